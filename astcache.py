@@ -0,0 +1,156 @@
+# A two-tier cache around brewparse.parse_program.
+#
+# Programs are keyed by a hash of their source text and the grammar signature from
+# parsetab.py, so regenerating the parser tables invalidates every entry. The first
+# tier is an in-process LRU of parsed Element trees; the second is a directory of
+# marshal-encoded trees with LRU eviction (by access time) under a byte budget.
+# A hit in either tier never touches PLY; brewparse is only imported on a miss.
+#
+# Trees handed out by the memo tier are shared between callers, so anything that
+# mutates the AST in a way that changes how it runs must use memo_size=0.
+
+import hashlib
+import marshal
+import os
+import tempfile
+from collections import OrderedDict
+
+from element import Element
+
+CACHE_FORMAT_VERSION = 2
+CACHE_SUFFIX = ".ast"
+
+
+def grammar_signature():
+    import parsetab
+    return parsetab._lr_signature
+
+
+# Elements become (elem_type, lineno, ((key, value), ...)) tuples and lists stay lists;
+# the parser never produces tuples itself, so the encoding is unambiguous
+def encode_ast(node):
+    if isinstance(node, Element):
+        return (
+            node.elem_type,
+            node.lineno,
+            tuple((key, encode_ast(value)) for key, value in node.dict.items()),
+        )
+    if isinstance(node, list):
+        return [encode_ast(item) for item in node]
+    return node
+
+
+def decode_ast(data):
+    if isinstance(data, tuple):
+        elem_type, lineno, fields = data
+        node = Element(elem_type, **{key: decode_ast(value) for key, value in fields})
+        node.lineno = lineno
+        return node
+    if isinstance(data, list):
+        return [decode_ast(item) for item in data]
+    return data
+
+
+class ASTCache:
+    def __init__(self, cache_dir=None, max_bytes=64 * 1024 * 1024, memo_size=128):
+        self.cache_dir = cache_dir  # None disables the on-disk tier
+        self.max_bytes = max_bytes
+        self.memo_size = memo_size
+        self.memo = OrderedDict()  # key -> Element
+        self.signature = grammar_signature()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, program):
+        h = hashlib.sha256()
+        h.update(f"{CACHE_FORMAT_VERSION}\0{self.signature}\0".encode())
+        h.update(program.encode())
+        return h.hexdigest()
+
+    def parse_program(self, program):
+        key = self.key_for(program)
+        ast = self.memo.get(key)
+        if ast is not None:
+            self.memo.move_to_end(key)
+            self.hits += 1
+            return ast
+
+        ast = self.__load(key)
+        if ast is not None:
+            self.disk_hits += 1
+        else:
+            from brewparse import parse_program
+            ast = parse_program(program)  # raises SyntaxError, which is never cached
+            self.misses += 1
+            self.__store(key, ast)
+        self.__remember(key, ast)
+        return ast
+
+    def clear(self):
+        self.memo.clear()
+        if self.cache_dir is None:
+            return
+        for path, _, _ in self.__entries():
+            os.remove(path)
+
+    def __remember(self, key, ast):
+        if self.memo_size <= 0:
+            return
+        self.memo[key] = ast
+        if len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+
+    def __path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def __load(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self.__path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used for eviction
+            return decode_ast(marshal.loads(data))
+        except (OSError, ValueError, EOFError, TypeError):
+            return None  # missing or unreadable entries are simply re-parsed
+
+    def __store(self, key, ast):
+        if self.cache_dir is None:
+            return
+        data = marshal.dumps(encode_ast(ast))
+        if len(data) > self.max_bytes:
+            return
+        # write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.__path(key))
+        self.__evict()
+
+    def __entries(self):
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_SUFFIX):
+                    st = entry.stat()
+                    entries.append((entry.path, st.st_mtime, st.st_size))
+        return entries
+
+    def __evict(self):
+        entries = self.__entries()
+        total = sum(size for _, _, size in entries)
+        if total <= self.max_bytes:
+            return
+        entries.sort(key=lambda e: e[1])  # least recently used first
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,124 @@
+# Runs a suite of Brewin test programs across a pool of worker processes.
+#
+# Each test is a .br file that may carry its input and expected output in blocks like
+#   *IN*      (optional; one input line per line)
+#   *OUT*     (the output lines, then the ErrorType if the program ends in an error)
+# usually inside a trailing comment, as in test.br. Workers import the interpreter
+# module (and with it the lexer and parser tables) once when they start and then run
+# tests one after another, so each test only pays for parsing and running its program.
+# Results are reported as tests finish, not in submission order.
+#
+#   python batchrunner.py [-j WORKERS] [-i INTERPRETER_MODULE] [-c CHUNK_SIZE] test.br ...
+
+import argparse
+import concurrent.futures
+import importlib
+import os
+import sys
+import time
+
+DEFAULT_INTERPRETER = "interpreterv4"
+
+_interpreter_module = None  # the worker's interpreter module, imported once
+
+
+class TestResult:
+    def __init__(self, path, output, expected, wall_time, crash=None):
+        self.path = path
+        self.output = output  # output lines, then the ErrorType if the run failed
+        self.expected = expected  # None if the test has no *OUT* block
+        self.wall_time = wall_time  # seconds spent parsing and running the program
+        self.crash = crash  # description of an exception the interpreter didn't report
+
+    def passed(self):
+        return self.crash is None and self.output == self.expected
+
+    def status(self):
+        if self.crash is not None:
+            return "CRASH"
+        if self.expected is None:
+            return "RAN"
+        return "PASS" if self.passed() else "FAIL"
+
+
+# the lines between the first two occurrences of marker, or None if there aren't two
+def extract_block(source, marker):
+    parts = source.split(marker)
+    if len(parts) < 3:
+        return None
+    block = parts[1].strip("\n")
+    if not block:
+        return []
+    return block.split("\n")
+
+
+def warm_worker(interpreter_name):
+    global _interpreter_module
+    _interpreter_module = importlib.import_module(interpreter_name)
+
+
+def run_test(path):
+    with open(path, "r") as f:
+        program = f.read()
+    inp = extract_block(program, "*IN*") or []
+    expected = extract_block(program, "*OUT*")
+    interpreter = _interpreter_module.Interpreter(console_output=False, inp=inp)
+    crash = None
+    start = time.perf_counter()
+    try:
+        interpreter.run(program)
+    except Exception as e:
+        if interpreter.get_error_type_and_line()[0] is None:
+            crash = f"{type(e).__name__}: {e}"
+    wall_time = time.perf_counter() - start
+    output = list(interpreter.get_output())
+    error_type = interpreter.get_error_type_and_line()[0]
+    if error_type is not None:
+        output.append(str(error_type))
+    return TestResult(path, output, expected, wall_time, crash)
+
+
+def run_test_chunk(paths):
+    return [run_test(path) for path in paths]
+
+
+# yields a TestResult for each of paths as soon as it finishes; tests are sent to the
+# workers chunk_size at a time, so that short tests aren't dominated by the round trip
+def run_tests(paths, workers=None, interpreter_name=DEFAULT_INTERPRETER, chunk_size=8):
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=warm_worker, initargs=(interpreter_name,)
+    ) as executor:
+        futures = [
+            executor.submit(run_test_chunk, paths[i:i + chunk_size]) for i in range(0, len(paths), chunk_size)
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            yield from future.result()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run Brewin test programs in parallel.")
+    arg_parser.add_argument("paths", nargs="+", help="Brewin test programs")
+    arg_parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="worker processes")
+    arg_parser.add_argument("-i", "--interpreter", default=DEFAULT_INTERPRETER, help="interpreter module")
+    arg_parser.add_argument("-c", "--chunk-size", type=int, default=8, help="tests sent to a worker at a time")
+    args = arg_parser.parse_args()
+
+    counts = {}
+    start = time.perf_counter()
+    for result in run_tests(args.paths, args.workers, args.interpreter, args.chunk_size):
+        status = result.status()
+        counts[status] = counts.get(status, 0) + 1
+        print(f"{status:<6} {result.wall_time * 1000:9.1f}ms  {result.path}")
+        if status == "FAIL":
+            print(f"       expected {result.expected}\n       got      {result.output}")
+        elif status == "CRASH":
+            print(f"       {result.crash}")
+    elapsed = time.perf_counter() - start
+    summary = ", ".join(f"{count} {status.lower()}" for status, count in sorted(counts.items()))
+    print(f"{len(args.paths)} programs in {elapsed:.2f}s with {args.workers} workers: {summary}")
+    if counts.get("FAIL") or counts.get("CRASH"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
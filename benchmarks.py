@@ -0,0 +1,346 @@
+# Microbenchmarks for the interpreter. Run one with
+#   python benchmarks.py <name>
+# or with no arguments to run them all.
+
+import copy
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from type_valuev3 import Value, TypeManager
+from element import Element
+import brewdescent
+import brewparse
+import interpreterv3
+import interpreterv3_vm
+
+
+def timed(label, f):
+    start = time.perf_counter()
+    result = f()
+    print(f"{label:<40} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+LINKED_LIST_PROGRAM = """
+struct node { val: int; next: node; }
+func main(): void {
+  var head: node; var n: node; var i: int;
+  for (i = 0; i < 100000; i = i + 1) {
+    n = new node;
+    n.val = i;
+    n.next = head;
+    head = n;
+  }
+  print(head.val);
+}
+"""
+
+
+# building a 100k-node linked list: raw struct allocation with the old deepcopy of the
+# default template versus the precomputed field layout, then the full Brewin program
+def bench_structs():
+    type_manager = TypeManager()
+    type_manager.define_struct(Element(
+        "struct",
+        name="node",
+        fields=[Element("fielddef", name="val", var_type="int"), Element("fielddef", name="next", var_type="node")],
+    ))
+
+    def deepcopy_alloc():
+        template = type_manager.struct_defs["node"]
+        for _ in range(100000):
+            Value("node", copy.deepcopy(template))
+
+    def layout_alloc():
+        for _ in range(100000):
+            type_manager.new_struct_value("node")
+
+    timed("struct alloc x100k, deepcopy (before)", deepcopy_alloc)
+    timed("struct alloc x100k, layout (after)", layout_alloc)
+    for label, kwargs in (("tree walker", {}), ("closures", {"compile_closures": True})):
+        interpreter = interpreterv3.Interpreter(console_output=False, **kwargs)
+        timed(f"100k-node linked list, {label}", lambda: interpreter.run(LINKED_LIST_PROGRAM))
+
+
+WIDE_STRUCT_PROGRAM = """
+struct rec { a: int; b: int; c: bool; d: string; e: rec; }
+func main(): void {
+  var head: rec; var r: rec; var i: int;
+  for (i = 0; i < 50000; i = i + 1) {
+    r = new rec;
+    r.a = i; r.b = i * 2; r.c = i; r.d = "x";
+    r.e = head;
+    head = r;
+  }
+  print(head.a + head.e.b);
+}
+"""
+
+
+def measure_memory(label, f):
+    tracemalloc.start()
+    f()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{label:<40} peak traced {peak / (1024 * 1024):.2f} MiB, max RSS {max_rss:.1f} MiB")
+
+
+# peak traced memory and process RSS for a program holding 50k five-field structs
+def bench_memory():
+    interpreter = interpreterv3.Interpreter(console_output=False)
+    measure_memory("50k-struct list, tree walker", lambda: interpreter.run(WIDE_STRUCT_PROGRAM))
+
+
+SMALL_VALUES_PROGRAM = """
+struct cell { n: int; flag: bool; next: cell; }
+func main(): void {
+  var head: cell; var c: cell; var i: int; var j: int; var t: int;
+  for (i = 0; i < 50000; i = i + 1) {
+    c = new cell;
+    c.n = i - (i / 100) * 100;
+    c.flag = c.n < 50;
+    c.next = head;
+    head = c;
+  }
+  for (j = 0; j < 5; j = j + 1) {
+    for (c = head; c != nil; c = c.next) {
+      if (c.flag) { t = t + 1; }
+    }
+  }
+  print(t);
+}
+"""
+
+
+# small ints and bools held in 50k structs, then re-read in a loop; with interned
+# values the fields share Value objects instead of each owning one
+def bench_values():
+    for label, kwargs in (("tree walker", {}), ("closures", {"compile_closures": True})):
+        interpreter = interpreterv3.Interpreter(console_output=False, **kwargs)
+        timed(f"small values, {label}", lambda: interpreter.run(SMALL_VALUES_PROGRAM))
+    interpreter = interpreterv3.Interpreter(console_output=False)
+    measure_memory("small values, tree walker", lambda: interpreter.run(SMALL_VALUES_PROGRAM))
+
+
+NESTED_LOOP_PROGRAM = """
+struct vec { x: int; y: int; }
+func main(): void {
+  var i: int; var j: int; var t: int; var v: vec;
+  v = new vec; v.x = 3; v.y = 4;
+  for (i = 0; i < 200; i = i + 1) {
+    for (j = 0; j < 500; j = j + 1) {
+      t = t + v.x * v.y - i;
+      if (j > 1000) { t = t - 1; }
+    }
+  }
+  print(t);
+}
+"""
+
+DEEP_RECURSION_PROGRAM = """
+func depth(n: int): int { if (n == 0) { return 0; } return 1 + depth(n - 1); }
+func main(): void { print(depth(100000)); }
+"""
+
+
+ENGINES = (
+    ("tree walker", lambda: interpreterv3.Interpreter(console_output=False)),
+    ("closures", lambda: interpreterv3.Interpreter(console_output=False, compile_closures=True)),
+    ("bytecode vm", lambda: interpreterv3_vm.Interpreter(console_output=False)),
+)
+
+
+# the same loop-heavy program on each execution engine, then 100k-deep recursion on the VM
+def bench_engines():
+    for label, make_interpreter in ENGINES:
+        interpreter = make_interpreter()
+        timed(f"nested loops, {label}", lambda: interpreter.run(NESTED_LOOP_PROGRAM))
+    interpreter = interpreterv3_vm.Interpreter(console_output=False)
+    timed("100k-deep recursion, bytecode vm", lambda: interpreter.run(DEEP_RECURSION_PROGRAM))
+
+
+RECURSIVE_PROGRAM = """
+func fib(n: int): int {
+  if (n < 2) { return n; }
+  return fib(n - 1) + fib(n - 2);
+}
+func ack(m: int, n: int): int {
+  if (m == 0) { return n + 1; }
+  if (n == 0) { return ack(m - 1, 1); }
+  return ack(m - 1, ack(m, n - 1));
+}
+func main(): void { print(fib(inputi()), " ", ack(inputi(), inputi())); }
+"""
+
+
+# fib(20) and ackermann(2, 30) fit in the Python stack on every engine; ackermann(3, 6)
+# recurses ~500 Brewin calls deep, which only the VM's explicit frame stack can take
+def bench_recursion():
+    for label, inp in (("fib(20) + ack(2, 30)", ["20", "2", "30"]), ("fib(1) + ack(3, 6)", ["1", "3", "6"])):
+        for engine, make_interpreter in ENGINES:
+            interpreter = make_interpreter()
+            interpreter.inp = inp
+            try:
+                timed(f"{label}, {engine}", lambda: interpreter.run(RECURSIVE_PROGRAM))
+            except RecursionError:
+                print(f"{label + ', ' + engine:<40} RecursionError")
+
+
+PURE_FUNCTIONS_PROGRAM = """
+func fib(n: int): int { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); }
+func binom(n: int, k: int): int {
+  if (k == 0 || k == n) { return 1; }
+  return binom(n - 1, k - 1) + binom(n - 1, k);
+}
+func main(): void { print(fib(20), " ", binom(16, 8)); }
+"""
+
+
+# exponential-time pure recursion on the tree walker, without and with the memo cache
+def bench_memo():
+    for memo_size in (None, 1024):
+        interpreter = interpreterv3.Interpreter(console_output=False, memo_size=memo_size)
+        timed(f"fib(20) + binom(16, 8), memo {memo_size}", lambda: interpreter.run(PURE_FUNCTIONS_PROGRAM))
+    print(f"memo hits {interpreter.memo.hits}, misses {interpreter.memo.misses}")
+
+
+CONSTANT_HEAVY_PROGRAM = """
+func main(): void {
+  var i: int; var t: int; var label: string;
+  for (i = 0; i < 20000; i = i + 1) {
+    t = t + 3 * 60 * 60 - (24 * 60) / 2;
+    label = "prefix" + "-" + "x";
+    if (true) { t = t - 1; } else { t = t + 1; }
+    if (1 > 2 || !true) { print("never"); }
+  }
+  print(t, label);
+}
+"""
+
+
+# the tree walker on a program full of constant expressions, without and with folding
+def bench_fold():
+    for fold_constants in (False, True):
+        interpreter = interpreterv3.Interpreter(console_output=False, fold_constants=fold_constants)
+        timed(f"constant-heavy loop, fold {fold_constants}", lambda: interpreter.run(CONSTANT_HEAVY_PROGRAM))
+    print(f"nodes eliminated {interpreter.constant_folder.nodes_eliminated}")
+
+
+INVARIANT_LOOP_PROGRAM = """
+struct vec { x: int; y: int; }
+func dot(ax: int, ay: int, bx: int, by: int): int { return ax * bx + ay * by; }
+func main(): void {
+  var i: int; var j: int; var t: int; var p: vec; var q: vec;
+  p = new vec; p.x = 3; p.y = 4; q = new vec; q.x = 2; q.y = 7;
+  for (i = 0; i < 200; i = i + 1) {
+    for (j = 0; j < 100; j = j + 1) {
+      t = t + (p.x * p.x + p.y * p.y) * j - dot(p.x, p.y, q.x, q.y) * i + (q.x - q.y) * (i - j);
+    }
+  }
+  print(t);
+}
+"""
+
+
+# the tree walker on nested loops reading struct fields, without and with invariant
+# hoisting
+def bench_hoist():
+    for label, program in (("nested loops", NESTED_LOOP_PROGRAM), ("field-heavy loops", INVARIANT_LOOP_PROGRAM)):
+        for hoist_invariants in (False, True):
+            interpreter = interpreterv3.Interpreter(console_output=False, hoist_invariants=hoist_invariants)
+            timed(f"{label}, hoist {hoist_invariants}", lambda: interpreter.run(program))
+        hoister = interpreter.hoister
+        print(f"expressions hoisted {hoister.expressions_hoisted}, nodes {hoister.nodes_hoisted}")
+
+
+# median wall time of a fresh process importing interpreterv3, with the lexer and parser
+# loaded from their tables versus built and checked from the rules as PLY normally does
+def bench_startup():
+    here = os.path.dirname(os.path.abspath(__file__))
+    for label, verify in (("verified tables (before)", "1"), ("precomputed tables (after)", "0")):
+        env = dict(os.environ, BREWIN_VERIFY_TABLES=verify)
+        times = []
+        for _ in range(21):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", "import interpreterv3"], cwd=here, env=env, check=True)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        print(f"{'startup, ' + label:<40} {times[len(times) // 2] * 1000:8.1f}ms")
+
+
+LEXER_SAMPLE = """
+/* a comment
+   over two lines */
+func scale(p: point, k: int): point {
+  var q: point;
+  q = new point;
+  q.x = p.x * k; q.y = p.y * k;
+  if (q.x >= 1000 || q.y <= -1000 && !(k == 0)) { print("big ", q.x, " ", q.y); }
+  return q;
+}
+"""
+
+
+# tokens per second over ~1 MB of Brewin source, with PLY's lexer and with brewscan's
+def bench_lexer():
+    source = LEXER_SAMPLE * (1024 * 1024 // len(LEXER_SAMPLE) + 1)
+    for lexer_name, prototype in brewparse.LEXERS.items():
+        lexer = prototype.clone()
+
+        def lex_all():
+            lexer.lineno = 1
+            lexer.input(source)
+            count = 0
+            while lexer.token() is not None:
+                count += 1
+            return count
+
+        start = time.perf_counter()
+        count = lex_all()
+        elapsed = time.perf_counter() - start
+        print(f"{'lex 1 MB, ' + lexer_name:<40} {elapsed:8.3f}s {count / elapsed:12,.0f} tokens/s")
+
+
+PARSERS = (
+    ("lalr", brewparse.parse_program),
+    ("descent", brewdescent.parse_program),
+)
+
+
+# the same sample parsed as one ~100 KB program, by each parser with each lexer
+def bench_parser():
+    source = LEXER_SAMPLE * (100 * 1024 // len(LEXER_SAMPLE) + 1)
+    for parser_name, parse_program in PARSERS:
+        for lexer_name in brewparse.LEXERS:
+            timed(f"parse 100 KB, {parser_name} + {lexer_name}", lambda: parse_program(source, lexer_name))
+
+
+BENCHMARKS = {
+    "structs": bench_structs,
+    "memory": bench_memory,
+    "values": bench_values,
+    "engines": bench_engines,
+    "recursion": bench_recursion,
+    "memo": bench_memo,
+    "fold": bench_fold,
+    "hoist": bench_hoist,
+    "startup": bench_startup,
+    "lexer": bench_lexer,
+    "parser": bench_parser,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+# A recursive-descent parser for Brewin, with Pratt parsing for expressions, that
+# builds exactly the same Element trees (line numbers included) as the PLY parser
+# in brewparse.py and fails on exactly the same token, with the same message. It also
+# recovers from syntax errors the way the PLY parser does (see brewparse.p_error):
+# the offending token and everything before it are dropped and parsing starts again
+# with a new program, staying quiet about errors until three tokens have been
+# consumed. parsecheck.py compares the two parsers on a corpus.
+#
+# Binding powers come from brewparse.precedence: each row binds tighter than the
+# rows above it, so OR < AND < comparisons < PLUS/MINUS < MULTIPLY/DIVIDE < unary.
+#
+# Like the PLY parser with position tracking, a node's lineno is the line of the
+# first token of the rule that built it; for a binary operator that is the first
+# token of its left operand, which may be an opening parenthesis.
+
+import queue
+
+from brewparse import LEXERS, p_error, precedence
+from element import Element
+from intbase import InterpreterBase
+
+# token type -> (left binding power, right binding power) of a binary operator
+BINARY_OPS = {}
+# binding power of the operand of a prefix operator
+PREFIX_POWER = {}
+for level, (assoc, *token_types) in enumerate(precedence, start=1):
+    for token_type in token_types:
+        BINARY_OPS[token_type] = (level, level - 1 if assoc == "right" else level)
+PREFIX_POWER["NOT"] = BINARY_OPS.pop("NOT")[0]
+PREFIX_POWER["MINUS"] = BINARY_OPS.pop("UMINUS")[0]
+
+LITERALS = {
+    "NUMBER": InterpreterBase.INT_NODE,
+    "STRING": InterpreterBase.STRING_NODE,
+    "TRUE": InterpreterBase.BOOL_NODE,
+    "FALSE": InterpreterBase.BOOL_NODE,
+    "NIL": InterpreterBase.NIL_NODE,
+}
+
+# tokens that can start an expression statement
+EXPRESSION_START = {"NAME", "NOT", "MINUS", "NEW", "LPAREN"} | set(LITERALS)
+STATEMENT_START = {"VAR", "IF", "TRY", "FOR", "RAISE", "RETURN"} | EXPRESSION_START
+
+
+# a syntax error at tok (None at EOF), unwinding to DescentParser.parse
+class ParseError(Exception):
+    def __init__(self, tok):
+        self.tok = tok
+
+
+def node(elem_type, lineno, **kwargs):
+    element = Element(elem_type, **kwargs)
+    element.lineno = lineno
+    return element
+
+
+# Like brewparse.BrewinParser: owns a clone of a lexer and its parse state, and must
+# only be used by one thread at a time.
+class DescentParser:
+    def __init__(self, lexer_name="ply"):
+        self.lexer = LEXERS[lexer_name].clone()
+        self.tok = None
+        self.consumed = 0  # tokens consumed since parsing last (re)started
+        self.syntax_errors = 0  # syntax errors reported by the last parse
+
+    def parse(self, program):
+        self.lexer.lineno = 1
+        self.lexer.input(program)
+        self.next_token = self.lexer.token
+        self.tok = self.next_token()
+        self.syntax_errors = 0
+        quiet = False  # PLY doesn't report an error within three tokens of the last
+        while True:
+            self.consumed = 0
+            try:
+                return self.program()
+            except ParseError as e:
+                if not quiet or self.consumed >= 3:
+                    self.syntax_errors += 1
+                    p_error(e.tok)
+                if e.tok is None:
+                    raise SyntaxError("Syntax error")
+                quiet = True
+                self.tok = self.next_token()
+
+    def error(self, tok):
+        raise ParseError(tok)
+
+    def advance(self):
+        tok = self.tok
+        self.tok = self.next_token()
+        self.consumed += 1
+        return tok
+
+    def expect(self, token_type):
+        if self.tok is None or self.tok.type != token_type:
+            self.error(self.tok)
+        return self.advance()
+
+    def at(self, token_type):
+        return self.tok is not None and self.tok.type == token_type
+
+    def program(self):
+        if self.tok is None:
+            self.error(None)
+        lineno = self.tok.lineno
+        structs = []
+        while self.at("STRUCT"):
+            structs.append(self.struct())
+        functions = [self.func()]
+        while self.at("FUNC"):
+            functions.append(self.func())
+        if self.tok is not None:
+            self.error(self.tok)
+        return node(InterpreterBase.PROGRAM_NODE, lineno, structs=structs, functions=functions)
+
+    def struct(self):
+        lineno = self.advance().lineno
+        name = self.expect("NAME").value
+        self.expect("LBRACE")
+        fields = [self.field()]
+        while not self.at("RBRACE"):
+            fields.append(self.field())
+        self.advance()
+        return node(InterpreterBase.STRUCT_NODE, lineno, name=name, fields=fields)
+
+    def field(self):
+        name_tok = self.expect("NAME")
+        self.expect("COLON")
+        var_type = self.expect("NAME").value
+        self.expect("SEMI")
+        return node(InterpreterBase.FIELD_DEF_NODE, name_tok.lineno, name=name_tok.value, var_type=var_type)
+
+    def func(self):
+        lineno = self.expect("FUNC").lineno
+        name = self.expect("NAME").value
+        self.expect("LPAREN")
+        args = []
+        if not self.at("RPAREN"):
+            args.append(self.formal_arg())
+            while self.at("COMMA"):
+                self.advance()
+                args.append(self.formal_arg())
+        self.expect("RPAREN")
+        return_type = None
+        if self.at("COLON"):
+            self.advance()
+            return_type = self.expect("NAME").value
+        statements = self.block()
+        return node(
+            InterpreterBase.FUNC_NODE, lineno, name=name, args=args, return_type=return_type, statements=statements
+        )
+
+    def formal_arg(self):
+        name_tok = self.expect("NAME")
+        var_type = None
+        if self.at("COLON"):
+            self.advance()
+            var_type = self.expect("NAME").value
+        return node(InterpreterBase.ARG_NODE, name_tok.lineno, name=name_tok.value, var_type=var_type)
+
+    # LBRACE statements RBRACE, where statements is one or more statements
+    def block(self):
+        self.expect("LBRACE")
+        statements = [self.statement()]
+        while not self.at("RBRACE"):
+            statements.append(self.statement())
+        self.advance()
+        return statements
+
+    def statement(self):
+        tok = self.tok
+        kind = tok.type if tok is not None else None
+        if kind not in STATEMENT_START:
+            self.error(tok)
+        if kind == "VAR":
+            self.advance()
+            name = self.expect("NAME").value
+            var_type = None
+            if self.at("COLON"):
+                self.advance()
+                var_type = self.expect("NAME").value
+            self.expect("SEMI")
+            return node(InterpreterBase.VAR_DEF_NODE, tok.lineno, name=name, var_type=var_type)
+        if kind == "IF":
+            self.advance()
+            self.expect("LPAREN")
+            condition = self.expression()
+            self.expect("RPAREN")
+            statements = self.block()
+            else_statements = None
+            if self.at("ELSE"):
+                self.advance()
+                else_statements = self.block()
+            return node(
+                InterpreterBase.IF_NODE,
+                tok.lineno,
+                condition=condition,
+                statements=statements,
+                else_statements=else_statements,
+            )
+        if kind == "TRY":
+            self.advance()
+            statements = self.block()
+            catchers = [self.catch()]
+            while self.at("CATCH"):
+                catchers.append(self.catch())
+            return node(InterpreterBase.TRY_NODE, tok.lineno, statements=statements, catchers=catchers)
+        if kind == "FOR":
+            self.advance()
+            self.expect("LPAREN")
+            init = self.assign()
+            self.expect("SEMI")
+            condition = self.expression()
+            self.expect("SEMI")
+            update = self.assign()
+            self.expect("RPAREN")
+            statements = self.block()
+            return node(
+                InterpreterBase.FOR_NODE, tok.lineno, init=init, condition=condition, update=update, statements=statements
+            )
+        if kind == "RAISE":
+            self.advance()
+            exception_type = self.expression()
+            self.expect("SEMI")
+            return node(InterpreterBase.RAISE_NODE, tok.lineno, exception_type=exception_type)
+        if kind == "RETURN":
+            self.advance()
+            expression = None
+            if not self.at("SEMI"):
+                expression = self.expression()
+            self.expect("SEMI")
+            return node(InterpreterBase.RETURN_NODE, tok.lineno, expression=expression)
+
+        # an assignment, or an expression statement
+        if kind == "NAME":
+            self.advance()
+            if self.at("LPAREN"):
+                left = self.call(tok)
+            else:
+                name = self.dotted_name(tok)
+                if self.at("ASSIGN"):
+                    self.advance()
+                    statement = node("=", tok.lineno, name=name, expression=self.expression())
+                    self.expect("SEMI")
+                    return statement
+                left = node(InterpreterBase.VAR_NODE, tok.lineno, name=name)
+            statement = self.binary_operators(left, tok.lineno, 0)
+        else:
+            statement = self.expression()
+        self.expect("SEMI")
+        return statement
+
+    def catch(self):
+        lineno = self.expect("CATCH").lineno
+        exception_type = self.expect("STRING").value
+        statements = self.block()
+        return node(InterpreterBase.CATCH_NODE, lineno, exception_type=exception_type, statements=statements)
+
+    def assign(self):
+        name_tok = self.expect("NAME")
+        name = self.dotted_name(name_tok)
+        self.expect("ASSIGN")
+        return node("=", name_tok.lineno, name=name, expression=self.expression())
+
+    # NAME (DOT NAME)*, with the first NAME already consumed
+    def dotted_name(self, name_tok):
+        name = name_tok.value
+        while self.at("DOT"):
+            self.advance()
+            name = name + "." + self.expect("NAME").value
+        return name
+
+    # NAME LPAREN [args] RPAREN, with the NAME already consumed
+    def call(self, name_tok):
+        self.advance()
+        args = []
+        if not self.at("RPAREN"):
+            args.append(self.expression())
+            while self.at("COMMA"):
+                self.advance()
+                args.append(self.expression())
+        self.expect("RPAREN")
+        return node(InterpreterBase.FCALL_NODE, name_tok.lineno, name=name_tok.value, args=args)
+
+    def expression(self, min_power=0):
+        left, lineno = self.prefix()
+        return self.binary_operators(left, lineno, min_power)
+
+    # lineno is the line of the first token of left, including any parentheses
+    def binary_operators(self, left, lineno, min_power):
+        while self.tok is not None:
+            powers = BINARY_OPS.get(self.tok.type)
+            if powers is None or powers[0] <= min_power:
+                break
+            oper = self.advance().value
+            right = self.expression(powers[1])
+            left = node(oper, lineno, op1=left, op2=right)
+        return left
+
+    # returns the operand and the line of its first token
+    def prefix(self):
+        tok = self.tok
+        kind = tok.type if tok is not None else None
+        if kind not in EXPRESSION_START:
+            self.error(tok)
+        self.advance()
+        if kind == "NAME":
+            if self.at("LPAREN"):
+                return self.call(tok), tok.lineno
+            return node(InterpreterBase.VAR_NODE, tok.lineno, name=self.dotted_name(tok)), tok.lineno
+        if kind == "LPAREN":
+            inner = self.expression()
+            self.expect("RPAREN")
+            return inner, tok.lineno
+        if kind in PREFIX_POWER:
+            operand = self.expression(PREFIX_POWER[kind])
+            elem_type = InterpreterBase.NOT_NODE if kind == "NOT" else InterpreterBase.NEG_NODE
+            return node(elem_type, tok.lineno, op1=operand), tok.lineno
+        if kind == "NEW":
+            return node(InterpreterBase.NEW_NODE, tok.lineno, var_type=self.expect("NAME").value), tok.lineno
+        if kind == "NIL":
+            return node(InterpreterBase.NIL_NODE, tok.lineno), tok.lineno
+        if kind == "TRUE" or kind == "FALSE":
+            return node(InterpreterBase.BOOL_NODE, tok.lineno, val=tok.value == InterpreterBase.TRUE_DEF), tok.lineno
+        return node(LITERALS[kind], tok.lineno, val=tok.value), tok.lineno
+
+
+_idle_parsers = {lexer_name: queue.SimpleQueue() for lexer_name in LEXERS}
+
+
+# a drop-in replacement for brewparse.parse_program
+def parse_program(program, lexer_name="ply"):
+    idle = _idle_parsers[lexer_name]
+    try:
+        parser = idle.get_nowait()
+    except queue.Empty:
+        parser = DescentParser(lexer_name)
+    try:
+        return parser.parse(program)
+    finally:
+        idle.put(parser)
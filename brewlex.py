@@ -1,6 +1,15 @@
 
+import os
+
 from ply import lex
 
+# The lexer and parser are normally loaded straight from the tables PLY generated
+# earlier (lextab.py and parsetab.py), without reflecting over these modules or
+# checking the grammar. Set BREWIN_VERIFY_TABLES=1 to build them from the rules the
+# slow way, which validates the grammar but writes nothing to the source tree; delete
+# lextab.py and parsetab.py to have them regenerated on the next import.
+VERIFY_TABLES = os.environ.get("BREWIN_VERIFY_TABLES") == "1"
+
 reserved = (
     "VAR",
     "FUNC",
@@ -132,5 +141,19 @@ def t_error(t):
 def reset_lineno():
     lexer.lineno = 1
 
+def build_lexer():
+    if not VERIFY_TABLES:
+        try:
+            lexobj = lex.Lexer()
+            lexobj.readtab("lextab", globals())
+            return lexobj
+        except ImportError:
+            pass  # no lextab.py yet, or one from another PLY version
+    lexobj = lex.lex()
+    if not VERIFY_TABLES:
+        lexobj.writetab("lextab", os.path.dirname(os.path.abspath(__file__)))
+    return lexobj
+
+
 # Build the lexer
-lexer = lex.lex()
+lexer = build_lexer()
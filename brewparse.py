@@ -1,5 +1,9 @@
+import copy
+import queue
+
 from element import Element
 from brewlex import *
+from brewscan import BrewinScanner
 from intbase import InterpreterBase
 from ply import yacc
 
@@ -14,6 +18,14 @@ precedence = (
     ("right", "UMINUS", "NOT"),
 )
 
+# every node records the line its first symbol starts on (parse_program turns on
+# position tracking so that this also works when that symbol is a nonterminal)
+def make_node(p, elem_type, **kwargs):
+    node = Element(elem_type, **kwargs)
+    node.lineno = p.lineno(1)
+    return node
+
+
 def collapse_items(p, group_index, singleton_index):
     if len(p) == 2:
         p[0] = [p[1]]
@@ -26,9 +38,9 @@ def p_program(p):
     """program : structs funcs
     | funcs"""
     if len(p) == 2:
-        p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=[], functions=p[1])
+        p[0] = make_node(p, InterpreterBase.PROGRAM_NODE, structs=[], functions=p[1])
     else:
-        p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=p[1], functions=p[2])
+        p[0] = make_node(p, InterpreterBase.PROGRAM_NODE, structs=p[1], functions=p[2])
 
 def p_structs(p):
     """structs : structs struct
@@ -37,7 +49,7 @@ def p_structs(p):
 
 def p_struct(p):
    "struct : STRUCT NAME LBRACE fields RBRACE"
-   p[0] = Element(InterpreterBase.STRUCT_NODE, name=p[2], fields=p[4])
+   p[0] = make_node(p, InterpreterBase.STRUCT_NODE, name=p[2], fields=p[4])
 
 def p_fields(p):
    """fields : fields field
@@ -46,7 +58,7 @@ def p_fields(p):
 
 def p_field(p):
   "field : NAME COLON NAME SEMI"  # field_name: type
-  p[0] = Element(InterpreterBase.FIELD_DEF_NODE, name=p[1], var_type=p[3])
+  p[0] = make_node(p, InterpreterBase.FIELD_DEF_NODE, name=p[1], var_type=p[3])
 
 def p_funcs(p):
     """funcs : funcs func
@@ -58,17 +70,17 @@ def p_func(p):
     """func : FUNC NAME LPAREN formal_args RPAREN COLON NAME LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN COLON NAME LBRACE statements RBRACE"""
     if len(p) == 11:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = p[7], statements=p[9])
+        p[0] = make_node(p, InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = p[7], statements=p[9])
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = p[6], statements=p[8])
+        p[0] = make_node(p, InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = p[6], statements=p[8])
 
 def p_func2(p):
     """func : FUNC NAME LPAREN formal_args RPAREN LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN LBRACE statements RBRACE"""
     if len(p) == 9:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = None, statements=p[7])
+        p[0] = make_node(p, InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = None, statements=p[7])
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = None, statements=p[6])
+        p[0] = make_node(p, InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = None, statements=p[6])
 
 def p_formal_args(p):
     """formal_args : formal_args COMMA formal_arg
@@ -80,9 +92,9 @@ def p_formal_arg(p):
     """formal_arg : NAME COLON NAME
     | NAME"""
     if len(p) == 2:
-      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = None)
+      p[0] = make_node(p, InterpreterBase.ARG_NODE, name=p[1], var_type = None)
     else:
-      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = p[3])
+      p[0] = make_node(p, InterpreterBase.ARG_NODE, name=p[1], var_type = p[3])
 
 def p_statements(p):
     """statements : statements statement
@@ -96,15 +108,15 @@ def p_statement___assign(p):
 
 def p_assign(p):
     "assign : variable_w_dot ASSIGN expression"
-    p[0] = Element("=", name=p[1], expression=p[3])
+    p[0] = make_node(p, "=", name=p[1], expression=p[3])
 
 def p_statement___var(p):
     """statement : VAR variable COLON NAME SEMI
     | VAR variable SEMI"""
     if len(p) == 6:
-      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=p[4])
+      p[0] = make_node(p, InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=p[4])
     else:
-      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=None)
+      p[0] = make_node(p, InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=None)
 
 def p_variable(p):
     "variable : NAME"
@@ -123,14 +135,14 @@ def p_statement_if(p):
     | IF LPAREN expression RPAREN LBRACE statements RBRACE ELSE LBRACE statements RBRACE
     """
     if len(p) == 8:
-        p[0] = Element(
+        p[0] = make_node(p, 
             InterpreterBase.IF_NODE,
             condition=p[3],
             statements=p[6],
             else_statements=None,
         )
     else:
-        p[0] = Element(
+        p[0] = make_node(p, 
             InterpreterBase.IF_NODE,
             condition=p[3],
             statements=p[6],
@@ -139,7 +151,7 @@ def p_statement_if(p):
 
 def p_statement_try(p):
     """statement : TRY LBRACE statements RBRACE catchers"""
-    p[0] = Element(InterpreterBase.TRY_NODE, statements=p[3], catchers=p[5])
+    p[0] = make_node(p, InterpreterBase.TRY_NODE, statements=p[3], catchers=p[5])
 
 def p_catches(p):
     """catchers : catchers catch
@@ -148,15 +160,15 @@ def p_catches(p):
 
 def p_catch(p):
     "catch : CATCH STRING LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.CATCH_NODE, exception_type=p[2], statements=p[4])
+    p[0] = make_node(p, InterpreterBase.CATCH_NODE, exception_type=p[2], statements=p[4])
 
 def p_statement_for(p):
     "statement : FOR LPAREN assign SEMI expression SEMI assign RPAREN LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.FOR_NODE, init=p[3], condition=p[5], update=p[7], statements=p[10])
+    p[0] = make_node(p, InterpreterBase.FOR_NODE, init=p[3], condition=p[5], update=p[7], statements=p[10])
 
 def p_statement_raise(p):
     "statement : RAISE expression SEMI"
-    p[0] = Element(InterpreterBase.RAISE_NODE, exception_type=p[2])
+    p[0] = make_node(p, InterpreterBase.RAISE_NODE, exception_type=p[2])
 
 def p_statement_expr(p):
     "statement : expression SEMI"
@@ -170,21 +182,21 @@ def p_statement_return(p):
         expr = p[2]
     else:
         expr = None
-    p[0] = Element(InterpreterBase.RETURN_NODE, expression=expr)
+    p[0] = make_node(p, InterpreterBase.RETURN_NODE, expression=expr)
 
 
 def p_expression_not(p):
     "expression : NOT expression"
-    p[0] = Element(InterpreterBase.NOT_NODE, op1=p[2])
+    p[0] = make_node(p, InterpreterBase.NOT_NODE, op1=p[2])
 
 
 def p_expression_uminus(p):
     "expression : MINUS expression %prec UMINUS"
-    p[0] = Element(InterpreterBase.NEG_NODE, op1=p[2])
+    p[0] = make_node(p, InterpreterBase.NEG_NODE, op1=p[2])
 
 def p_expression_new(p):
     "expression : NEW NAME"
-    p[0] = Element(InterpreterBase.NEW_NODE, var_type=p[2])
+    p[0] = make_node(p, InterpreterBase.NEW_NODE, var_type=p[2])
 
 
 def p_arith_expression_binop(p):
@@ -198,7 +210,7 @@ def p_arith_expression_binop(p):
     | expression MINUS expression
     | expression MULTIPLY expression
     | expression DIVIDE expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = make_node(p, p[2], op1=p[1], op2=p[3])
 
 
 def p_expression_group(p):
@@ -209,43 +221,43 @@ def p_expression_group(p):
 def p_expression_and_or(p):
     """expression : expression OR expression
     | expression AND expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = make_node(p, p[2], op1=p[1], op2=p[3])
 
 
 def p_expression_number(p):
     "expression : NUMBER"
-    p[0] = Element(InterpreterBase.INT_NODE, val=p[1])
+    p[0] = make_node(p, InterpreterBase.INT_NODE, val=p[1])
 
 
 def p_expression_bool(p):
     """expression : TRUE
     | FALSE"""
     bool_val = p[1] == InterpreterBase.TRUE_DEF
-    p[0] = Element(InterpreterBase.BOOL_NODE, val=bool_val)
+    p[0] = make_node(p, InterpreterBase.BOOL_NODE, val=bool_val)
 
 
 def p_expression_nil(p):
     "expression : NIL"
-    p[0] = Element(InterpreterBase.NIL_NODE)
+    p[0] = make_node(p, InterpreterBase.NIL_NODE)
 
 
 def p_expression_string(p):
     "expression : STRING"
-    p[0] = Element(InterpreterBase.STRING_NODE, val=p[1])
+    p[0] = make_node(p, InterpreterBase.STRING_NODE, val=p[1])
 
 
 def p_expression_variable(p):
     "expression : variable_w_dot"
-    p[0] = Element(InterpreterBase.VAR_NODE, name=p[1])
+    p[0] = make_node(p, InterpreterBase.VAR_NODE, name=p[1])
 
 
 def p_func_call(p):
     """expression : NAME LPAREN args RPAREN
     | NAME LPAREN RPAREN"""
     if len(p) == 5:
-        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=p[3])
+        p[0] = make_node(p, InterpreterBase.FCALL_NODE, name=p[1], args=p[3])
     else:
-        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=[])
+        p[0] = make_node(p, InterpreterBase.FCALL_NODE, name=p[1], args=[])
 
 
 def p_expression_args(p):
@@ -254,6 +266,12 @@ def p_expression_args(p):
     collapse_items(p, 1, 3)
 
 
+# PLY calls this for a syntax error and then recovers: the grammar has no error
+# productions, so it discards everything parsed so far and the offending token, and
+# starts a new program at the next one. Errors within three tokens of the last one
+# aren't reported. A program that reaches EOF in error parses to None, which
+# parse_program raises as a SyntaxError; otherwise the tree is whatever followed the
+# last error
 def p_error(p):
     if p:
         print(f"Syntax error at '{p.value}' on line {p.lineno}")
@@ -261,14 +279,71 @@ def p_error(p):
         print("Syntax error at EOF")
 
 
-# exported function
-def parse_program(program):
-    reset_lineno()
-    ast = yacc.parse(program)
-    if ast is None:
-        raise SyntaxError("Syntax error")
-    return ast
+# the lexers a BrewinParser can use, all producing the same tokens: PLY's, and the
+# hand-written one in brewscan.py
+LEXERS = {
+    "ply": lexer,
+    "scanner": BrewinScanner(),
+}
+
+
+# A parser with its own lexer and parse state. The LALR tables and grammar rules are
+# shared, read-only, with every other instance. One BrewinParser must only be used
+# by one thread at a time; parse_program hands them out from a pool.
+# PLY keeps its error recovery state (stacks and error count) in the parser object, so
+# each BrewinParser recovers on its own, and reports errors through its own error();
+# PLY's module-level errok()/token()/restart() hooks are never used.
+class BrewinParser:
+    def __init__(self, lexer_name="ply"):
+        self.lexer = LEXERS[lexer_name].clone()
+        self.parser = copy.copy(_shared_parser)
+        self.parser.errorfunc = self.error
+        self.syntax_errors = 0  # syntax errors reported by the last parse
+
+    def error(self, p):
+        self.syntax_errors += 1
+        p_error(p)
+
+    def parse(self, program):
+        self.lexer.lineno = 1
+        self.syntax_errors = 0
+        ast = self.parser.parse(program, lexer=self.lexer, tracking=True)
+        if ast is None:
+            raise SyntaxError("Syntax error")
+        return ast
+
+
+# lexer name -> BrewinParsers using that lexer that aren't in use by any thread
+_idle_parsers = {lexer_name: queue.SimpleQueue() for lexer_name in LEXERS}
+
+
+# exported function; safe to call from any number of threads at once
+def parse_program(program, lexer_name="ply"):
+    idle = _idle_parsers[lexer_name]
+    try:
+        parser = idle.get_nowait()
+    except queue.Empty:
+        parser = BrewinParser(lexer_name)
+    try:
+        return parser.parse(program)
+    finally:
+        idle.put(parser)
+
+
+def build_parser():
+    if not VERIFY_TABLES:
+        try:
+            tables = yacc.LRTable()
+            tables.read_table("parsetab")
+            tables.bind_callables(globals())
+            return yacc.LRParser(tables, p_error)
+        except (ImportError, yacc.VersionError):
+            pass  # no parsetab.py yet, or one from another PLY version
+    if VERIFY_TABLES:
+        # leave parsetab.py and parser.out alone, even if this Python computes another signature
+        return yacc.yacc(debug=False, write_tables=False)
+    return yacc.yacc() # yacc.yacc(debug=True, debuglog=open("parse.log", "w"))
 
 
 # generate our parser
-yacc.yacc() # yacc.yacc(debug=True, debuglog=open("parse.log", "w"))
+_shared_parser = build_parser()
@@ -0,0 +1,145 @@
+# A hand-written lexer for Brewin, producing the same token stream as the PLY
+# lexer in brewlex.py: the same types, values, line numbers and positions, with
+# comments, newlines, spaces and tabs skipped. It can stand in for the PLY lexer
+# wherever brewparse takes one (see brewparse.LEXERS).
+#
+# PLY tries its rules at each position in a fixed order and takes the first match:
+#   NUMBER, NAME (then reserved_map), newlines, /* comments */, "strings",
+#   two-character operators, one-character tokens, and finally DOT, whose rule
+#   is an unescaped "." and so matches any character other than a newline.
+# The scanner dispatches on the current character instead, checking the common
+# cases first, in a way that always picks the token PLY would. An unterminated
+# comment or string falls through to DIVIDE or DOT, just as it does with PLY.
+
+import re
+
+from brewlex import reserved_map
+
+_NAME_START = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_")
+_NAME_REST = re.compile(r"\w*")
+_DIGITS = re.compile(r"\d+")
+_BLANKS = re.compile(r"[ \t]*")
+
+_TWO_CHAR_TOKENS = {
+    "||": "OR",
+    "&&": "AND",
+    "==": "EQ",
+    "!=": "NOT_EQ",
+    ">=": "GREATER_EQ",
+    "<=": "LESS_EQ",
+}
+
+_ONE_CHAR_TOKENS = {
+    "(": "LPAREN",
+    ")": "RPAREN",
+    "{": "LBRACE",
+    "}": "RBRACE",
+    "+": "PLUS",
+    "-": "MINUS",
+    "*": "MULTIPLY",
+    ",": "COMMA",
+    ":": "COLON",
+    ";": "SEMI",
+    ">": "GREATER",
+    "<": "LESS",
+    "=": "ASSIGN",
+    "/": "DIVIDE",
+    "!": "NOT",
+}
+
+
+# one-character tokens that can't start a longer token, unless followed by "=";
+# "/" is left out because it can start a comment
+_SIMPLE_TOKENS = {c: kind for c, kind in _ONE_CHAR_TOKENS.items() if c != "/"}
+
+
+class Token:
+    # lexer is only set by the parser, on the token it reports a syntax error for
+    __slots__ = ("type", "value", "lineno", "lexpos", "lexer")
+
+    def __init__(self, type, value, lineno, lexpos):
+        self.type = type
+        self.value = value
+        self.lineno = lineno
+        self.lexpos = lexpos
+
+    def __repr__(self):
+        return f"LexToken({self.type},{self.value!r},{self.lineno},{self.lexpos})"
+
+
+# Implements the part of the ply.lex.Lexer interface the parser uses. input() scans
+# the whole program in one pass; token() then hands the tokens out one at a time.
+class BrewinScanner:
+    def __init__(self):
+        self.lineno = 1
+        self.lexpos = 0
+        self.tokens = iter(())
+
+    def clone(self):
+        return BrewinScanner()
+
+    def input(self, data):
+        self.tokens = iter(self.scan(data))
+
+    def token(self):
+        return next(self.tokens, None)
+
+    def scan(self, data):
+        tokens = []
+        append = tokens.append
+        name_rest = _NAME_REST.match
+        blanks = _BLANKS.match
+        digits = _DIGITS.match
+        reserved_get = reserved_map.get
+        one_char_get = _SIMPLE_TOKENS.get
+        lineno = self.lineno
+        pos = 0
+        end = len(data)
+        while pos < end:
+            c = data[pos]
+            if c in _NAME_START:
+                stop = name_rest(data, pos + 1).end()
+                value = data[pos:stop]
+                append(Token(reserved_get(value, "NAME"), value, lineno, pos))
+                pos = stop
+                continue
+            if c == " " or c == "\t":
+                pos = blanks(data, pos + 1).end()
+                continue
+            if c == "\n":
+                lineno += 1
+                pos += 1
+                continue
+            kind = one_char_get(c)
+            if kind is not None and data[pos + 1:pos + 2] != "=":
+                append(Token(kind, c, lineno, pos))
+                pos += 1
+                continue
+            if c.isdecimal():
+                stop = digits(data, pos).end()
+                append(Token("NUMBER", int(data[pos:stop]), lineno, pos))
+                pos = stop
+                continue
+            if c == '"':
+                close = data.find('"', pos + 1)
+                if close != -1 and data.find("\n", pos + 1, close) == -1:
+                    append(Token("STRING", data[pos + 1:close], lineno, pos))
+                    pos = close + 1
+                    continue
+            elif c == "/" and data.startswith("*", pos + 1):
+                close = data.find("*/", pos + 2)
+                if close != -1:
+                    lineno += data.count("\n", pos, close)
+                    pos = close + 2
+                    continue
+            pair = data[pos:pos + 2]
+            kind = _TWO_CHAR_TOKENS.get(pair)
+            if kind is not None:
+                append(Token(kind, pair, lineno, pos))
+                pos += 2
+                continue
+            append(Token(_ONE_CHAR_TOKENS.get(c, "DOT"), c, lineno, pos))
+            pos += 1
+        self.lineno = lineno
+        self.lexpos = end
+        return tokens
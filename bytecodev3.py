@@ -0,0 +1,464 @@
+# A bytecode backend for v3 Brewin programs.
+#
+# BytecodeCompiler turns each function into a CodeObject: a flat list of
+# (opcode, operands...) tuples, a constant pool, and the frame size computed by
+# resolverv3.SlotResolver. Jumps hold absolute instruction indices. The VM runs the
+# code in a single loop with an explicit frame stack, so Brewin recursion depth is
+# not limited by the Python stack, only by the VM's max_stack_bytes: the estimated
+# memory held by the frames of all the calls in progress.
+#
+# Instructions follow the tree walker's evaluation order exactly (e.g. the target of
+# an assignment is looked up before its right-hand side is evaluated, and each
+# argument is type-checked before the next one is evaluated), so programs produce the
+# same output and the same errors under either engine.
+
+import sys
+
+from intbase import InterpreterBase, ErrorType
+from resolverv3 import UNBOUND_SLOT, split_name
+from type_valuev3 import Type, Value, Variable, TypeManager, int_value, bool_value, literal_value
+
+# opcodes
+LOAD_CONST = 0  # (const index) -> value
+LOAD_VAR = 1  # (slot, name) -> value
+LOAD_PATH = 2  # (slot, path, offsets) -> value of a dotted variable
+GET_VAR = 3  # (slot, name) -> Variable, the target of an assignment
+GET_PATH = 4  # (slot, path, offsets) -> Variable
+STORE = 5  # Variable, value ->
+BINARY_OP = 6  # (oper, type -> operator lambda) left, right -> result
+NEG = 7
+NOT = 8
+JUMP = 9  # (target)
+JUMP_IF_FALSE = 10  # (target, construct name used in the error message) condition ->
+CALL = 11  # (CodeObject) args... -> return value
+BIND_ARG = 12  # (arg type, arg name) value -> coerced value
+RETURN = 13  # value ->
+RETURN_DEFAULT = 14
+POP = 15
+VAR_DEF = 16  # (slot, var type, default value)
+PRINT = 17  # (number of args) args... -> void
+CHECK_NOT_VOID = 18
+INPUT = 19  # (result type, has prompt) [prompt] -> value
+NEW = 20  # (struct type)
+FAIL = 21  # (error type, message)
+TRACE = 22  # (statement)
+
+# the default for VM.max_stack_bytes; about two million frames of a small function
+DEFAULT_MAX_STACK_BYTES = 512 * 1024 * 1024
+
+OPCODE_NAMES = {
+    value: name for name, value in globals().items() if isinstance(value, int) and name.isupper()
+}
+
+
+class CodeObject:
+    __slots__ = ("name", "code", "consts", "frame_size", "formals", "return_type", "frame_bytes")
+
+    def __init__(self, func_ast):
+        self.name = func_ast.get("name")
+        self.code = []
+        self.consts = []
+        self.frame_size = func_ast.get("frame_size")
+        self.formals = tuple((a.get("slot"), a.get("var_type")) for a in func_ast.get("args"))
+        self.return_type = func_ast.get("return_type")
+        # what one call holds while it runs: its slots, its (initially empty) operand
+        # stack, the Variables bound to its arguments, and the caller's saved state
+        self.frame_bytes = (
+            sys.getsizeof([None] * self.frame_size)
+            + sys.getsizeof([])
+            + len(self.formals) * sys.getsizeof(Variable(None))
+            + sys.getsizeof((None,) * 6)
+        )
+
+    def disassemble(self):
+        lines = [f"{self.name}/{len(self.formals)} (frame size {self.frame_size})"]
+        for pc, instr in enumerate(self.code):
+            operands = ", ".join(self.__format_operand(o) for o in instr[1:] if not isinstance(o, dict))
+            lines.append(f"{pc:5} {OPCODE_NAMES[instr[0]]:<16} {operands}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def __format_operand(operand):
+        if isinstance(operand, CodeObject):
+            return f"{operand.name}/{len(operand.formals)}"
+        if isinstance(operand, Value):
+            return f"{operand.type()} {TypeManager.get_printable(operand)}"
+        return str(operand)
+
+
+class BytecodeCompiler:
+    def __init__(self, interp):
+        self.interp = interp
+        self.type_manager = interp.type_manager
+        self.code_objects = {}  # (name, num args) -> CodeObject
+        self.cur = None  # CodeObject being compiled
+
+    # every function is compiled up front; calls to functions that don't exist
+    # compile to a FAIL instruction so they only error if executed
+    def compile_program(self):
+        func_asts = []
+        for name, by_arity in self.interp.func_name_to_ast.items():
+            for num_args, func_ast in by_arity.items():
+                self.code_objects[(name, num_args)] = CodeObject(func_ast)
+                func_asts.append(((name, num_args), func_ast))
+        for key, func_ast in func_asts:
+            self.cur = self.code_objects[key]
+            self.__compile_statements(func_ast.get("statements"))
+            self.__emit(RETURN_DEFAULT)
+        return self.code_objects
+
+    def __emit(self, *instr):
+        self.cur.code.append(instr)
+        return len(self.cur.code) - 1
+
+    def __patch(self, index, target):
+        instr = self.cur.code[index]
+        self.cur.code[index] = (instr[0], target) + instr[2:]
+
+    def __const(self, value):
+        consts = self.cur.consts
+        for i, c in enumerate(consts):
+            if c is value:
+                return i
+        consts.append(value)
+        return len(consts) - 1
+
+    def __compile_statements(self, statements):
+        for statement in statements:
+            if self.interp.trace_output:
+                self.__emit(TRACE, statement)
+            self.__compile_statement(statement)
+
+    def __compile_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            self.__compile_call(statement)
+            self.__emit(POP)
+        elif kind == "=":
+            self.__compile_assign(statement)
+        elif kind == InterpreterBase.VAR_DEF_NODE:
+            self.__compile_var_def(statement)
+        elif kind == InterpreterBase.RETURN_NODE:
+            expr_ast = statement.get("expression")
+            if expr_ast is None:
+                self.__emit(RETURN_DEFAULT)
+            else:
+                self.__compile_expr(expr_ast)
+                self.__emit(RETURN)
+        elif kind == InterpreterBase.IF_NODE:
+            self.__compile_if(statement)
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__compile_for(statement)
+
+    def __compile_assign(self, assign_ast):
+        path = split_name(assign_ast)
+        if len(path) == 1:
+            self.__emit(GET_VAR, assign_ast.get("slot"), path[0])
+        else:
+            self.__emit(GET_PATH, assign_ast.get("slot"), path, [None])
+        self.__compile_expr(assign_ast.get("expression"))
+        self.__emit(STORE)
+
+    def __compile_var_def(self, var_ast):
+        var_name = var_ast.get("name")
+        var_type = var_ast.get("var_type")
+        default_value = self.type_manager.create_default_value(var_type)
+        if default_value is None or not self.type_manager.valid_var_type(var_type):
+            self.__emit(FAIL, ErrorType.TYPE_ERROR, f"Unknown/invalid type specified {var_type}")
+        elif var_ast.get("slot") == UNBOUND_SLOT:
+            self.__emit(FAIL, ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}")
+        else:
+            self.__emit(VAR_DEF, var_ast.get("slot"), var_type, default_value)
+
+    def __compile_if(self, if_ast):
+        self.__compile_expr(if_ast.get("condition"))
+        jump_to_else = self.__emit(JUMP_IF_FALSE, None, "if")
+        self.__compile_statements(if_ast.get("statements"))
+        else_statements = if_ast.get("else_statements")
+        if else_statements is None:
+            self.__patch(jump_to_else, len(self.cur.code))
+            return
+        jump_to_end = self.__emit(JUMP, None)
+        self.__patch(jump_to_else, len(self.cur.code))
+        self.__compile_statements(else_statements)
+        self.__patch(jump_to_end, len(self.cur.code))
+
+    def __compile_for(self, for_ast):
+        self.__compile_assign(for_ast.get("init"))
+        loop_top = len(self.cur.code)
+        self.__compile_expr(for_ast.get("condition"))
+        jump_to_end = self.__emit(JUMP_IF_FALSE, None, "for")
+        self.__compile_statements(for_ast.get("statements"))
+        self.__compile_assign(for_ast.get("update"))
+        self.__emit(JUMP, loop_top)
+        self.__patch(jump_to_end, len(self.cur.code))
+
+    def __compile_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind in (InterpreterBase.NIL_NODE, InterpreterBase.INT_NODE, InterpreterBase.STRING_NODE,
+                    InterpreterBase.BOOL_NODE):
+            self.__emit(LOAD_CONST, self.__const(literal_value(expr_ast)))
+        elif kind == InterpreterBase.VAR_NODE:
+            path = split_name(expr_ast)
+            if len(path) == 1:
+                self.__emit(LOAD_VAR, expr_ast.get("slot"), path[0])
+            else:
+                self.__emit(LOAD_PATH, expr_ast.get("slot"), path, [None])
+        elif kind == InterpreterBase.FCALL_NODE:
+            self.__compile_call(expr_ast)
+        elif kind == InterpreterBase.NEW_NODE:
+            self.__emit(NEW, expr_ast.get("var_type"))
+        elif kind in self.interp.BIN_OPS:
+            self.__compile_expr(expr_ast.get("op1"))
+            self.__compile_expr(expr_ast.get("op2"))
+            type_to_lambda = {}
+            for op_type, lambdas in self.interp.op_to_lambda.items():
+                if kind in lambdas:
+                    type_to_lambda[op_type] = lambdas[kind]
+            self.__emit(BINARY_OP, kind, type_to_lambda)
+        elif kind == InterpreterBase.NEG_NODE:
+            self.__compile_expr(expr_ast.get("op1"))
+            self.__emit(NEG)
+        elif kind == InterpreterBase.NOT_NODE:
+            self.__compile_expr(expr_ast.get("op1"))
+            self.__emit(NOT)
+
+    def __compile_call(self, call_ast):
+        func_name = call_ast.get("name")
+        actual_args = call_ast.get("args")
+        if func_name == "print":
+            for arg_ast in actual_args:
+                self.__compile_expr(arg_ast)
+                self.__emit(CHECK_NOT_VOID)
+            self.__emit(PRINT, len(actual_args))
+            return
+        if func_name == "inputi" or func_name == "inputs":
+            result_type = Type.INT if func_name == "inputi" else Type.STRING
+            if len(actual_args) > 1:
+                self.__emit(FAIL, ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter")
+            elif len(actual_args) == 1:
+                self.__compile_expr(actual_args[0])
+                self.__emit(CHECK_NOT_VOID)
+                self.__emit(INPUT, result_type, True)
+            else:
+                self.__emit(INPUT, result_type, False)
+            return
+
+        num_args = len(actual_args)
+        callee = self.code_objects.get((func_name, num_args))
+        if callee is None:
+            if func_name not in self.interp.func_name_to_ast:
+                self.__emit(FAIL, ErrorType.NAME_ERROR, f"Function {func_name} not found")
+            else:
+                self.__emit(
+                    FAIL, ErrorType.NAME_ERROR, f"Function {func_name} taking {num_args} params not found"
+                )
+            return
+        func_ast = self.interp.func_name_to_ast[func_name][num_args]
+        for formal_ast, arg_ast in zip(func_ast.get("args"), actual_args):
+            self.__compile_expr(arg_ast)
+            self.__emit(BIND_ARG, formal_ast.get("var_type"), formal_ast.get("name"))
+        self.__emit(CALL, callee)
+
+
+class VM:
+    # max_stack_bytes bounds the memory held by active frames (see CodeObject.frame_bytes);
+    # going past it raises RecursionError, as running out of Python stack does in the
+    # tree walker. None removes the bound.
+    def __init__(self, interp, coerce, compatible_for_assignment, eval_compare, eval_and_or,
+                 max_stack_bytes=DEFAULT_MAX_STACK_BYTES, **_):
+        self.interp = interp
+        self.max_stack_bytes = float("inf") if max_stack_bytes is None else max_stack_bytes
+        self.type_manager = interp.type_manager
+        self.coerce = coerce
+        self.compatible_for_assignment = compatible_for_assignment
+        self.eval_compare = eval_compare
+        self.eval_and_or = eval_and_or
+
+    # runs code_object (which takes no arguments) to completion and returns its value
+    def execute(self, code_object):
+        interp = self.interp
+        error = interp.error
+        type_manager = self.type_manager
+        coerce = self.coerce
+        compatible = self.compatible_for_assignment
+        max_stack_bytes = self.max_stack_bytes
+
+        frames = []  # saved (func, code, consts, pc, slots, stack) of each caller
+        func = code_object
+        code = func.code
+        consts = func.consts
+        pc = 0
+        slots = [None] * func.frame_size
+        stack = []
+        stack_bytes = func.frame_bytes
+        push = stack.append
+        pop = stack.pop
+
+        while True:
+            instr = code[pc]
+            pc += 1
+            op = instr[0]
+
+            if op == LOAD_VAR:
+                variable = slots[instr[1]]
+                if variable is None:
+                    error(ErrorType.NAME_ERROR, f"Undefined variable {instr[2]}")
+                push(variable.v)
+            elif op == LOAD_CONST:
+                push(consts[instr[1]])
+            elif op == BINARY_OP:
+                right = pop()
+                left = pop()
+                ltype = left.t
+                if ltype == right.t:
+                    f = instr[2].get(ltype)
+                    if f is not None:
+                        push(f(left, right))
+                        continue
+                push(self.__slow_binary_op(instr[1], left, right))
+            elif op == GET_VAR:
+                variable = slots[instr[1]]
+                if variable is None:
+                    error(ErrorType.NAME_ERROR, f"Undefined variable {instr[2]}")
+                push(variable)
+            elif op == STORE:
+                rhs_val = pop()
+                lhs_var = pop()
+                lhs_type = lhs_var.t
+                if lhs_type != rhs_val.t:
+                    if not compatible(lhs_var, rhs_val):
+                        error(
+                            ErrorType.TYPE_ERROR, f"Type mismatch {lhs_var.type()} vs {rhs_val.type()} in assignment"
+                        )
+                    if lhs_type == Type.BOOL:
+                        rhs_val = coerce(Type.BOOL, rhs_val)
+                    elif rhs_val.t == Type.NIL and type_manager.is_struct_type(lhs_type):
+                        rhs_val = coerce(lhs_type, rhs_val)
+                lhs_var.v = rhs_val
+            elif op == JUMP_IF_FALSE:
+                cond = pop()
+                if cond.t != Type.BOOL and cond.t != Type.INT:
+                    error(ErrorType.TYPE_ERROR, f"Incompatible type for {instr[2]} condition")
+                if not cond.v:
+                    pc = instr[1]
+            elif op == JUMP:
+                pc = instr[1]
+            elif op == LOAD_PATH:
+                push(self.__get_path(slots, instr).v)
+            elif op == GET_PATH:
+                push(self.__get_path(slots, instr))
+            elif op == BIND_ARG:
+                arg_type = instr[1]
+                result = stack[-1]
+                if result.t != arg_type:
+                    if not compatible(Variable(arg_type), result):
+                        error(ErrorType.TYPE_ERROR, f"Type mismatch on formal parameter {instr[2]}")
+                    stack[-1] = coerce(arg_type, result)
+            elif op == CALL:
+                callee = instr[1]
+                stack_bytes += callee.frame_bytes
+                if stack_bytes > max_stack_bytes:
+                    raise RecursionError(
+                        f"Brewin call stack exceeded {self.max_stack_bytes} bytes calling {callee.name}"
+                    )
+                new_slots = [None] * callee.frame_size
+                num_args = len(callee.formals)
+                if num_args:
+                    args = stack[-num_args:]
+                    del stack[-num_args:]
+                    for (slot, arg_type), value in zip(callee.formals, args):
+                        new_slots[slot] = Variable(arg_type, value)
+                frames.append((func, code, consts, pc, slots, stack))
+                func = callee
+                code = callee.code
+                consts = callee.consts
+                pc = 0
+                slots = new_slots
+                stack = []
+                push = stack.append
+                pop = stack.pop
+            elif op == RETURN or op == RETURN_DEFAULT:
+                return_type = func.return_type
+                if op == RETURN:
+                    value_obj = pop()
+                    if value_obj.t == Type.VOID:
+                        error(ErrorType.TYPE_ERROR, "Cannot use void in return value")
+                    if not compatible(Variable(return_type), value_obj):
+                        error(
+                            ErrorType.TYPE_ERROR,
+                            f"Returned value's type {value_obj.type()} is inconsistent with function's return type {return_type}"
+                        )
+                    value_obj = coerce(return_type, value_obj)
+                else:
+                    value_obj = type_manager.create_default_value(return_type)
+                if not frames:
+                    return value_obj
+                stack_bytes -= func.frame_bytes
+                func, code, consts, pc, slots, stack = frames.pop()
+                push = stack.append
+                pop = stack.pop
+                push(value_obj)
+            elif op == POP:
+                pop()
+            elif op == VAR_DEF:
+                slots[instr[1]] = Variable(instr[2], instr[3])
+            elif op == NEG:
+                value_obj = pop()
+                if value_obj.t != Type.INT:
+                    error(ErrorType.TYPE_ERROR, f"Incompatible type for {InterpreterBase.NEG_NODE} operation")
+                push(int_value(-value_obj.v))
+            elif op == NOT:
+                value_obj = pop()
+                if value_obj.t != Type.BOOL and value_obj.t != Type.INT:
+                    error(ErrorType.TYPE_ERROR, f"Incompatible type for {InterpreterBase.NOT_NODE} operation")
+                push(bool_value(not value_obj.v))
+            elif op == CHECK_NOT_VOID:
+                if stack[-1].t == Type.VOID:
+                    error(ErrorType.TYPE_ERROR, "Void not allowed as argument")
+            elif op == PRINT:
+                num_args = instr[1]
+                output = ""
+                if num_args:
+                    for result in stack[-num_args:]:
+                        output = output + TypeManager.get_printable(result)
+                    del stack[-num_args:]
+                interp.output(output)
+                push(interp.VOID_VALUE)
+            elif op == INPUT:
+                if instr[2]:
+                    interp.output(TypeManager.get_printable(pop()))
+                if instr[1] == Type.INT:
+                    push(int_value(interp.get_int_input()))
+                else:
+                    push(Value(Type.STRING, interp.get_input()))
+            elif op == NEW:
+                value = type_manager.new_struct_value(instr[1])
+                if value is None:
+                    error(ErrorType.TYPE_ERROR, f"Invalid type {instr[1]} for new operation")
+                push(value)
+            elif op == FAIL:
+                error(instr[1], instr[2])
+            elif op == TRACE:
+                print(instr[1])
+
+    def __slow_binary_op(self, oper, left, right):
+        if oper == "==" or oper == "!=":
+            return self.eval_compare(oper, left, right)
+        if oper == "||" or oper == "&&":
+            return self.eval_and_or(oper, left, right)
+        self.interp.error(
+            ErrorType.TYPE_ERROR,
+            f"Incompatible operator {oper} for types {left.type()} and {right.type()}",
+        )
+
+    # the offsets operand is a one-element list, filled in the first time the path is followed
+    def __get_path(self, slots, instr):
+        _, slot, path, offsets = instr
+        base_var = slots[slot]
+        if base_var is None:
+            self.interp.error(ErrorType.NAME_ERROR, f"Undefined variable {path[0]}")
+        if offsets[0] is not None:
+            return TypeManager.follow_field_offsets(base_var, offsets[0], path, self.interp.error)
+        base_var, offsets[0] = self.type_manager.resolve_field_path(base_var, path, self.interp.error)
+        return base_var
@@ -0,0 +1,522 @@
+# Compiles a v3 Brewin AST into a tree of pre-bound Python closures.
+# Each node is visited once; the closures it produces capture their children,
+# the operator lambdas, and any constant values, so running a program never
+# re-dispatches on elem_type strings the way the tree walker does.
+#
+# Statement closures return None to continue and a Value object to return.
+
+from intbase import InterpreterBase, ErrorType
+from resolverv3 import split_name
+from type_valuev3 import Type, Value, Variable, TypeManager, int_value, bool_value, literal_value
+
+
+class ClosureCompiler:
+    # interp is the owning Interpreter; the remaining arguments are its bound helpers
+    # so that coercion and comparison rules live in exactly one place
+    def __init__(self, interp, get_func_by_name, coerce, compatible_for_assignment, eval_compare, eval_and_or):
+        self.interp = interp
+        self.get_func_by_name = get_func_by_name
+        self.type_manager = interp.type_manager
+        self.env = interp.env
+        self.coerce = coerce
+        self.compatible_for_assignment = compatible_for_assignment
+        self.eval_compare = eval_compare
+        self.eval_and_or = eval_and_or
+        self.compiled_funcs = {}  # id(func_ast) -> invoke closure
+
+    def call_func(self, func_name, actual_args):
+        return self.compile_call(func_name, actual_args)()
+
+    # functions are compiled on first call, since calls to undefined functions
+    # must only fail if they are actually executed
+    def get_function(self, func_name, num_args):
+        func_ast = self.get_func_by_name(func_name, num_args)
+        invoke = self.compiled_funcs.get(id(func_ast))
+        if invoke is None:
+            invoke = self.compile_function(func_ast)
+            self.compiled_funcs[id(func_ast)] = invoke
+        return invoke
+
+    def compile_function(self, func_ast):
+        interp = self.interp
+        env = self.env
+        type_manager = self.type_manager
+        coerce = self.coerce
+        compatible = self.compatible_for_assignment
+        formals = [
+            (a.get("name"), interp.env_key(a, a.get("name")), a.get("var_type")) for a in func_ast.get("args")
+        ]
+        frame_size = func_ast.get("frame_size")
+        return_type = func_ast.get("return_type")
+        body = self.compile_block(func_ast.get("statements"), return_type)
+        if interp.profiler is not None:
+            body = self.__profiled_body(func_ast, body)
+
+        # safe_args[i] is True if the TypeChecker proved argument i needs no check
+        def invoke(arg_closures, safe_args):
+            args = {}
+            for (arg_name, arg_key, arg_type), arg_closure, safe in zip(formals, arg_closures, safe_args):
+                result = arg_closure()
+                if safe:
+                    args[arg_key] = Variable(arg_type, result)
+                    continue
+                if not compatible(Variable(arg_type), result):
+                    interp.error(
+                        ErrorType.TYPE_ERROR,
+                        f"Type mismatch on formal parameter {arg_name}"
+                    )
+                args[arg_key] = Variable(arg_type, coerce(arg_type, result))
+
+            env.push_func(frame_size)
+            for arg_key, variable in args.items():
+                env.create(arg_key, variable)
+            return_val = body()
+            env.pop_func()
+            if return_val is not None:
+                return return_val
+            return type_manager.create_default_value(return_type)
+
+        return invoke
+
+    def compile_block(self, statements, return_type):
+        env = self.env
+        compiled = [self.compile_statement(s, return_type) for s in statements]
+        if self.interp.trace_output:
+            compiled = [self.__traced(s, c) for s, c in zip(statements, compiled)]
+        if self.interp.profiler is not None:
+            compiled = [self.__counted(s, c) for s, c in zip(statements, compiled)]
+        compiled = tuple(c for c in compiled if c is not None)
+
+        def run_block():
+            env.push_block()
+            for statement in compiled:
+                return_val = statement()
+                if return_val is not None:
+                    env.pop_block()
+                    return return_val
+            env.pop_block()
+            return None
+
+        return run_block
+
+    @staticmethod
+    def __traced(statement, compiled):
+        def run_traced():
+            print(statement)
+            if compiled is not None:
+                return compiled()
+            return None
+
+        return run_traced
+
+    def __counted(self, statement, compiled):
+        count_line = self.interp.profiler.count_line
+        lineno = statement.lineno
+
+        def run_counted():
+            count_line(lineno)
+            if compiled is not None:
+                return compiled()
+            return None
+
+        return run_counted
+
+    def __profiled_body(self, func_ast, body):
+        profiler = self.interp.profiler
+
+        def run_profiled():
+            profiler.enter(func_ast)
+            try:
+                return body()
+            finally:
+                profiler.leave()
+
+        return run_profiled
+
+    # returns None for statements that have no effect when run
+    def compile_statement(self, statement, return_type):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            call = self.compile_expr(statement)
+
+            def run_call():
+                call()
+
+            return run_call
+        if kind == "=":
+            return self.compile_assign(statement)
+        if kind == InterpreterBase.VAR_DEF_NODE:
+            return self.compile_var_def(statement)
+        if kind == InterpreterBase.RETURN_NODE:
+            return self.compile_return(statement, return_type)
+        if kind == InterpreterBase.IF_NODE:
+            return self.compile_if(statement, return_type)
+        if kind == InterpreterBase.FOR_NODE:
+            return self.compile_for(statement, return_type)
+        return None
+
+    def compile_assign(self, assign_ast):
+        interp = self.interp
+        type_manager = self.type_manager
+        coerce = self.coerce
+        compatible = self.compatible_for_assignment
+        get_lhs = self.compile_variable(assign_ast.get("name"), assign_ast)
+        rhs = self.compile_expr(assign_ast.get("expression"))
+        if assign_ast.get("type_safe"):
+            def run_safe_assign():
+                get_lhs().v = rhs()
+
+            return run_safe_assign
+
+        def run_assign():
+            lhs_var = get_lhs()
+            rhs_val = rhs()
+            if lhs_var.t != rhs_val.t and not compatible(lhs_var, rhs_val):
+                interp.error(
+                    ErrorType.TYPE_ERROR, f"Type mismatch {lhs_var.type()} vs {rhs_val.type()} in assignment"
+                )
+            lhs_type = lhs_var.t
+            if lhs_type == Type.BOOL:
+                rhs_val = coerce(Type.BOOL, rhs_val)
+            elif rhs_val.t == Type.NIL and type_manager.is_struct_type(lhs_type):
+                rhs_val = coerce(lhs_type, rhs_val)
+            lhs_var.set_value(rhs_val)
+
+        return run_assign
+
+    def compile_var_def(self, var_ast):
+        interp = self.interp
+        env = self.env
+        var_name = var_ast.get("name")
+        var_key = interp.env_key(var_ast, var_name)
+        var_type = var_ast.get("var_type")
+        # Values are never mutated in place, so one default can be shared by every execution
+        default_value = self.type_manager.create_default_value(var_type)
+        if default_value is None or not self.type_manager.valid_var_type(var_type):
+            def run_bad_var_def():
+                interp.error(
+                    ErrorType.TYPE_ERROR, f"Unknown/invalid type specified {var_type}"
+                )
+
+            return run_bad_var_def
+
+        def run_var_def():
+            if not env.create(var_key, Variable(var_type, default_value)):
+                interp.error(
+                    ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}"
+                )
+
+        return run_var_def
+
+    def compile_return(self, return_ast, return_type):
+        interp = self.interp
+        coerce = self.coerce
+        compatible = self.compatible_for_assignment
+        expr_ast = return_ast.get("expression")
+        if expr_ast is None:
+            type_manager = self.type_manager
+
+            def run_empty_return():
+                return type_manager.create_default_value(return_type)
+
+            return run_empty_return
+
+        expr = self.compile_expr(expr_ast)
+        if return_ast.get("type_safe"):
+            return expr
+        return_var = Variable(return_type)
+
+        def run_return():
+            value_obj = expr()
+            if value_obj.type() == Type.VOID:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    "Cannot use void in return value"
+                )
+            if not compatible(return_var, value_obj):
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Returned value's type {value_obj.type()} is inconsistent with function's return type {return_type}"
+                )
+            return coerce(return_type, value_obj)
+
+        return run_return
+
+    def compile_if(self, if_ast, return_type):
+        interp = self.interp
+        cond = self.compile_expr(if_ast.get("condition"))
+        then_block = self.compile_block(if_ast.get("statements"), return_type)
+        else_statements = if_ast.get("else_statements")
+        else_block = None
+        if else_statements is not None:
+            else_block = self.compile_block(else_statements, return_type)
+
+        def run_if():
+            result = cond()
+            result_type = result.t
+            if result_type != Type.BOOL and result_type != Type.INT:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    "Incompatible type for if condition",
+                )
+            if result.v:
+                return then_block()
+            if else_block is not None:
+                return else_block()
+            return None
+
+        return run_if
+
+    def compile_for(self, for_ast, return_type):
+        interp = self.interp
+        init = self.compile_assign(for_ast.get("init"))
+        cond = self.compile_expr(for_ast.get("condition"))
+        update = self.compile_assign(for_ast.get("update"))
+        body = self.compile_block(for_ast.get("statements"), return_type)
+
+        def run_for():
+            init()
+            while True:
+                run_for = cond()
+                run_type = run_for.t
+                if run_type != Type.BOOL and run_type != Type.INT:
+                    interp.error(
+                        ErrorType.TYPE_ERROR,
+                        "Incompatible type for for condition",
+                    )
+                if not run_for.v:
+                    return None
+                return_val = body()
+                if return_val is not None:
+                    return return_val
+                update()
+
+        return run_for
+
+    # returns a closure that yields the Variable object named by var_name
+    def compile_variable(self, var_name, var_node):
+        interp = self.interp
+        env_get = self.env.get
+        type_manager = self.type_manager
+        path = split_name(var_node)
+        base_name = path[0]
+        base_key = interp.env_key(var_node, base_name)
+
+        def get_base():
+            base_var = env_get(base_key)
+            if base_var is None:
+                interp.error(
+                    ErrorType.NAME_ERROR, f"Undefined variable {base_name}"
+                )
+            return base_var
+
+        if len(path) == 1:
+            return get_base
+
+        follow_field_offsets = TypeManager.follow_field_offsets
+        offsets = None
+
+        def get_dotted():
+            nonlocal offsets
+            if offsets is not None:
+                return follow_field_offsets(get_base(), offsets, path, interp.error)
+            base_var, offsets = type_manager.resolve_field_path(get_base(), path, interp.error)
+            return base_var
+
+        return get_dotted
+
+    # plain (non-dotted) reads are by far the most common, so they get their own closure
+    def compile_var_read(self, var_name, var_node):
+        if "." in var_name:
+            get_var = self.compile_variable(var_name, var_node)
+
+            def eval_dotted_var():
+                return get_var().v
+
+            return eval_dotted_var
+
+        interp = self.interp
+        env_get = self.env.get
+        var_key = interp.env_key(var_node, var_name)
+
+        def eval_var():
+            variable = env_get(var_key)
+            if variable is None:
+                interp.error(
+                    ErrorType.NAME_ERROR, f"Undefined variable {var_name}"
+                )
+            return variable.v
+
+        return eval_var
+
+    def compile_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind in (InterpreterBase.NIL_NODE, InterpreterBase.INT_NODE, InterpreterBase.STRING_NODE,
+                    InterpreterBase.BOOL_NODE):
+            return self.__constant(literal_value(expr_ast))
+        if kind == InterpreterBase.VAR_NODE:
+            return self.compile_var_read(expr_ast.get("name"), expr_ast)
+        if kind == InterpreterBase.FCALL_NODE:
+            return self.compile_call(expr_ast.get("name"), expr_ast.get("args"), expr_ast.get("safe_args"))
+        if kind == InterpreterBase.NEW_NODE:
+            return self.compile_new(expr_ast)
+        if kind in self.interp.BIN_OPS:
+            return self.compile_op(expr_ast)
+        if kind == InterpreterBase.NEG_NODE:
+            return self.compile_neg(expr_ast)
+        if kind == InterpreterBase.NOT_NODE:
+            return self.compile_not(expr_ast)
+        return self.__constant(None)
+
+    @staticmethod
+    def __constant(value):
+        def eval_constant():
+            return value
+
+        return eval_constant
+
+    def compile_call(self, func_name, actual_args, safe_args=None):
+        if func_name == "print":
+            return self.compile_print(actual_args)
+        if func_name == "inputi" or func_name == "inputs":
+            return self.compile_input(func_name, actual_args)
+
+        get_function = self.get_function
+        arg_closures = tuple(self.compile_expr(a) for a in actual_args)
+        num_args = len(arg_closures)
+        if safe_args is None:
+            safe_args = (False,) * num_args
+        target = None
+
+        def eval_call():
+            nonlocal target
+            if target is None:
+                target = get_function(func_name, num_args)
+            return target(arg_closures, safe_args)
+
+        return eval_call
+
+    def compile_print(self, actual_args):
+        interp = self.interp
+        arg_closures = tuple(self.compile_expr(a) for a in actual_args)
+        get_printable = TypeManager.get_printable
+        void_value = interp.VOID_VALUE
+
+        def eval_print():
+            output = ""
+            for arg in arg_closures:
+                result = arg()
+                if result.type() == Type.VOID:
+                    interp.error(ErrorType.TYPE_ERROR, "Void not allowed as argument")
+                output = output + get_printable(result)
+            interp.output(output)
+            return void_value
+
+        return eval_print
+
+    def compile_input(self, func_name, actual_args):
+        interp = self.interp
+        prompt = None
+        if len(actual_args) == 1:
+            prompt = self.compile_expr(actual_args[0])
+        result_type = Type.INT if func_name == "inputi" else Type.STRING
+        too_many = len(actual_args) > 1
+
+        def eval_input():
+            if prompt is not None:
+                result = prompt()
+                if result.type() == Type.VOID:
+                    interp.error(ErrorType.TYPE_ERROR, "Void not allowed as argument")
+                interp.output(TypeManager.get_printable(result))
+            elif too_many:
+                interp.error(
+                    ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
+                )
+            if result_type == Type.INT:
+                return int_value(interp.get_int_input())
+            return Value(Type.STRING, interp.get_input())
+
+        return eval_input
+
+    def compile_new(self, new_ast):
+        interp = self.interp
+        type_manager = self.type_manager
+        var_type = new_ast.get("var_type")
+
+        def eval_new():
+            value = type_manager.new_struct_value(var_type)
+            if value is None:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Invalid type {var_type} for new operation",
+                )
+            return value
+
+        return eval_new
+
+    def compile_op(self, arith_ast):
+        interp = self.interp
+        oper = arith_ast.elem_type
+        left = self.compile_expr(arith_ast.get("op1"))
+        right = self.compile_expr(arith_ast.get("op2"))
+        # resolve the operator lambda for each operand type once, up front
+        type_to_lambda = {}
+        for op_type, lambdas in interp.op_to_lambda.items():
+            if oper in lambdas:
+                type_to_lambda[op_type] = lambdas[oper]
+        is_compare = oper in ("==", "!=")
+        is_and_or = oper in ("||", "&&")
+        eval_compare = self.eval_compare
+        eval_and_or = self.eval_and_or
+
+        def eval_op():
+            left_value_obj = left()
+            right_value_obj = right()
+            ltype = left_value_obj.t
+            if ltype == right_value_obj.t:
+                f = type_to_lambda.get(ltype)
+                if f is not None:
+                    return f(left_value_obj, right_value_obj)
+            if is_compare:
+                return eval_compare(oper, left_value_obj, right_value_obj)
+            if is_and_or:
+                return eval_and_or(oper, left_value_obj, right_value_obj)
+            interp.error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible operator {oper} for types {left_value_obj.type()} and {right_value_obj.type()}",
+            )
+
+        return eval_op
+
+    def compile_neg(self, arith_ast):
+        interp = self.interp
+        oper = arith_ast.elem_type
+        operand = self.compile_expr(arith_ast.get("op1"))
+
+        def eval_neg():
+            value_obj = operand()
+            if value_obj.type() != Type.INT:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Incompatible type for {oper} operation",
+                )
+            return int_value(-value_obj.value())
+
+        return eval_neg
+
+    def compile_not(self, arith_ast):
+        interp = self.interp
+        oper = arith_ast.elem_type
+        operand = self.compile_expr(arith_ast.get("op1"))
+
+        def eval_not():
+            value_obj = operand()
+            val_type = value_obj.type()
+            if val_type != Type.BOOL and val_type != Type.INT:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Incompatible type for {oper} operation",
+                )
+            return bool_value(not value_obj.value())
+
+        return eval_not
@@ -1,14 +1,16 @@
 class Element:
+    # the per-node fields stay in self.dict so later passes can annotate nodes,
+    # but slots avoid a second per-instance dictionary on every node
+    # lineno is the source line the node starts on, set by the parser
+    __slots__ = ("elem_type", "dict", "lineno")
+
     def __init__(self, elem_type, **kwargs):
         self.elem_type = elem_type
-        self.dict = {}
-        for key, value in kwargs.items():
-            self.dict[key] = value
+        self.dict = kwargs
+        self.lineno = None
 
     def get(self, key):
-        if key not in self.dict:
-            return None
-        return self.dict[key]
+        return self.dict.get(key)
 
     def __str__(self):
         s = f"{self.elem_type}: "
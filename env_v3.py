@@ -1,3 +1,6 @@
+from resolverv3 import UNBOUND_SLOT
+
+
 # The EnvironmentManager class keeps a mapping between each variable name (aka symbol)
 # in a brewin program and the Value object, which stores a type, and a value.
 class EnvironmentManager:
@@ -32,7 +35,8 @@ class EnvironmentManager:
         return True
 
     # used when we enter a new function - start with empty dictionary to hold parameters.
-    def push_func(self):
+    # frame_size is only needed by the FrameEnvironmentManager below
+    def push_func(self, frame_size=None):
         self.environment.append([{}])  # [[...]] -> [[...], [{}]]
 
     def push_block(self):
@@ -47,3 +51,48 @@ class EnvironmentManager:
     def pop_func(self):
         self.environment.pop()
 
+    # used for a tail call: the current function's activation record is reused, emptied,
+    # for the function it calls
+    def replace_func(self, frame_size=None):
+        self.environment[-1] = [{}]
+
+
+# The FrameEnvironmentManager stores each function's variables in a flat list indexed by
+# the slots assigned by resolverv3.SlotResolver, so symbols here are slot indices rather
+# than names. Scoping was already handled by the resolver, so blocks need no bookkeeping.
+# Slot 0 (UNBOUND_SLOT) is never written, so unresolved references read back None and
+# duplicate definitions fail to be created, just like with the EnvironmentManager.
+class FrameEnvironmentManager:
+    def __init__(self):
+        self.environment = []
+
+    # returns a VariableDef object
+    def get(self, slot):
+        return self.environment[-1][slot]
+
+    def set(self, slot, value):
+        if slot == UNBOUND_SLOT:
+            return False
+        self.environment[-1][slot] = value
+        return True
+
+    def create(self, slot, value):
+        if slot == UNBOUND_SLOT:
+            return False
+        self.environment[-1][slot] = value
+        return True
+
+    def push_func(self, frame_size):
+        self.environment.append([None] * frame_size)
+
+    def push_block(self):
+        pass
+
+    def pop_block(self):
+        pass
+
+    def pop_func(self):
+        self.environment.pop()
+
+    def replace_func(self, frame_size):
+        self.environment[-1] = [None] * frame_size
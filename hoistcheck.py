@@ -0,0 +1,142 @@
+# Checks that loop-invariant hoisting (Interpreter(hoist_invariants=True), see
+# optimizerv3.py) never changes what a program prints or the error it ends with, and
+# that a tree it ran on is still good for every engine. Each program is parsed once
+# into a shared astcache.ASTCache, then run by the hoisting tree walker twice and by
+# every engine in turn, and each run is compared with an unhoisted run on a fresh tree.
+#
+#   python hoistcheck.py [program.br ...]
+
+import sys
+
+import interpreterv3
+import interpreterv3_vm
+from astcache import ASTCache
+
+INPUT = ["7", "3", "word"]
+
+PROGRAMS = {
+    "struct fields": """
+struct vec { x: int; y: int; }
+func main(): void {
+  var i: int; var j: int; var t: int; var v: vec;
+  v = new vec; v.x = 3; v.y = 4;
+  for (i = 0; i < 20; i = i + 1) {
+    for (j = 0; j < 30; j = j + 1) {
+      t = t + v.x * v.y - i * (v.x + 1);
+    }
+  }
+  print(t);
+}
+""",
+    "field writes": """
+struct vec { x: int; y: int; }
+func bump(p: vec): void { p.x = p.x + 1; }
+func main(): void {
+  var i: int; var t: int; var v: vec; var w: vec;
+  v = new vec; w = v; v.x = 1;
+  for (i = 0; i < 5; i = i + 1) { t = t + v.x * 2; w.x = w.x + 1; }
+  for (i = 0; i < 5; i = i + 1) { t = t + v.x * 2; bump(w); }
+  print(t, " ", v.x);
+}
+""",
+    "pure calls": """
+func sq(a: int): int { return a * a; }
+func loud(a: int): int { print("loud ", a); return a; }
+func main(): void {
+  var i: int; var k: int; var t: int;
+  k = inputi();
+  for (i = 0; i < 10; i = i + 1) { t = t + sq(k + 1) + loud(k) - sq(i); }
+  print(t);
+}
+""",
+    "recursion": """
+func walk(n: int, k: int): int {
+  var i: int; var t: int;
+  if (n == 0) { return 0; }
+  for (i = 0; i < 3; i = i + 1) { t = t + k * k + walk(n - 1, k + 1); }
+  return t;
+}
+func main(): void { print(walk(4, 2)); }
+""",
+    "errors in loops": """
+struct vec { x: int; }
+func main(): void {
+  var i: int; var k: int; var v: vec;
+  for (i = 0; i < 3; i = i + 1) {
+    if (i == 2) { print(k / (k - k)); }
+    print(i);
+  }
+  for (i = 0; i < 3; i = i + 1) { print(v.x + 1); }
+}
+""",
+    "shadowing": """
+func main(): void {
+  var i: int; var x: int; x = 10;
+  for (i = 0; i < 3; i = i + 1) {
+    print(x * 2);
+    if (i > 0) { var x: int; x = i; print(x * 2); }
+  }
+}
+""",
+}
+
+ENGINES = (
+    ("hoisting tree walker", lambda cache: interpreterv3.Interpreter(
+        console_output=False, inp=list(INPUT), ast_cache=cache, hoist_invariants=True)),
+    ("hoisting tree walker again", lambda cache: interpreterv3.Interpreter(
+        console_output=False, inp=list(INPUT), ast_cache=cache, hoist_invariants=True)),
+    ("hoisting, by name", lambda cache: interpreterv3.Interpreter(
+        console_output=False, inp=list(INPUT), ast_cache=cache, hoist_invariants=True, resolve_slots=False)),
+    ("hoisting, typed + memo", lambda cache: interpreterv3.Interpreter(
+        console_output=False, inp=list(INPUT), ast_cache=cache, hoist_invariants=True, static_types=True,
+        memo_size=64)),
+    ("tree walker", lambda cache: interpreterv3.Interpreter(console_output=False, inp=list(INPUT), ast_cache=cache)),
+    ("closures", lambda cache: interpreterv3.Interpreter(
+        console_output=False, inp=list(INPUT), ast_cache=cache, compile_closures=True)),
+    ("bytecode vm", lambda cache: interpreterv3_vm.Interpreter(console_output=False, inp=list(INPUT), ast_cache=cache)),
+)
+
+
+# the output lines, then the ErrorType (or the name of the Python exception, such as
+# ZeroDivisionError) if the run ended in an error
+def outcome(interpreter, program):
+    failure = None
+    try:
+        interpreter.run(program)
+    except Exception as e:
+        failure = type(e).__name__
+    output = list(interpreter.get_output())
+    error_type = interpreter.get_error_type_and_line()[0]
+    if error_type is not None:
+        output.append(str(error_type))
+    elif failure is not None:
+        output.append(failure)
+    return output
+
+
+# returns the number of runs that differed from the unhoisted one
+def check(name, program):
+    expected = outcome(interpreterv3.Interpreter(console_output=False, inp=list(INPUT)), program)
+    cache = ASTCache()
+    mismatches = 0
+    for engine, make_interpreter in ENGINES:
+        got = outcome(make_interpreter(cache), program)
+        if got != expected:
+            mismatches += 1
+            print(f"MISMATCH {name}, {engine}\n  expected {expected}\n  got      {got}")
+    return mismatches
+
+
+def main():
+    programs = dict(PROGRAMS)
+    for path in sys.argv[1:]:
+        with open(path, "r") as f:
+            programs[path] = f.read()
+    mismatches = sum(check(name, program) for name, program in programs.items())
+    print(f"{len(programs)} programs x {len(ENGINES)} runs: {mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
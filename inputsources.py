@@ -0,0 +1,84 @@
+# Input sources for InterpreterBase. By default an interpreter reads each input from
+# the keyboard, or from the list it was given as inp; give it one of these as
+# input_source instead to stream input from a file, a pipe or an iterator without
+# holding it all in memory. A source has
+#   get_line()   the next line, without its line ending, or None once input runs out
+#   get_int()    the next line as an int, exactly as int(get_line()) would give it
+# Like a list that has run out, a source that has run out makes inputi() fail with the
+# same TypeError as int(None).
+
+import os
+
+
+# Reads lines from a binary file object (or a file descriptor, such as a pipe's) in
+# block_size reads, keeping at most one block and one partial line in memory.
+class StreamInput:
+    def __init__(self, file, block_size=64 * 1024, encoding="utf-8"):
+        self.file = os.fdopen(file, "rb", buffering=0) if isinstance(file, int) else file
+        self.block_size = block_size
+        self.encoding = encoding
+        self.buffer = b""
+        self.pos = 0  # start of the unread part of buffer
+        self.eof = False
+
+    @staticmethod
+    def open(path, block_size=64 * 1024, encoding="utf-8"):
+        return StreamInput(open(path, "rb", buffering=0), block_size, encoding)
+
+    def __next_line(self):
+        while True:
+            end = self.buffer.find(b"\n", self.pos)
+            if end != -1:
+                line = self.buffer[self.pos:end]
+                self.pos = end + 1
+                break
+            if self.eof:
+                if self.pos == len(self.buffer):
+                    return None
+                line = self.buffer[self.pos:]
+                self.pos = len(self.buffer)
+                break
+            block = self.file.read(self.block_size)
+            if not block:
+                self.eof = True
+            self.buffer = self.buffer[self.pos:] + block
+            self.pos = 0
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        return line
+
+    def get_line(self):
+        line = self.__next_line()
+        if line is None:
+            return None
+        return line.decode(self.encoding)
+
+    # int() parses the bytes in place; anything it rejects is retried as text, so that
+    # e.g. non-ASCII digits are accepted and bad input fails with the usual message
+    def get_int(self):
+        line = self.__next_line()
+        if line is None:
+            return int(None)
+        try:
+            return int(line)
+        except ValueError:
+            return int(line.decode(self.encoding))
+
+    def close(self):
+        self.file.close()
+
+
+# Takes lines from any iterable of strings, such as a generator or an open text file,
+# one at a time as they are needed.
+class IteratorInput:
+    def __init__(self, iterable):
+        self.lines = iter(iterable)
+
+    def get_line(self):
+        line = next(self.lines, None)
+        if isinstance(line, str) and line.endswith("\n"):
+            line = line[:-2] if line.endswith("\r\n") else line[:-1]
+        return line
+
+    def get_int(self):
+        return int(self.get_line())
@@ -40,14 +40,21 @@ class InterpreterBase:
     VOID_DEF = "void"
     
     # methods
-    def __init__(self, console_output=True, inp=None):
+    # output_sink, if not none, receives the output instead of output_log and the console
+    # (see outputsinks.py)
+    # input_source, if not none, supplies the input instead of inp (see inputsources.py)
+    def __init__(self, console_output=True, inp=None, output_sink=None, input_source=None):
         self.console_output = console_output
         self.inp = inp  # if not none, then read input from passed-in list
+        self.output_sink = output_sink
+        self.input_source = input_source
         self.reset()
 
     # Call to reset I/O for another run of the program
     def reset(self):
         self.output_log = []
+        if self.output_sink is not None:
+            self.output_sink.reset()
         self.input_cursor = 0
         self.error_type = None
         self.error_line = None
@@ -57,6 +64,8 @@ class InterpreterBase:
         pass
 
     def get_input(self):
+        if self.input_source is not None:
+            return self.input_source.get_line()
         if not self.inp:
             return input()  # Get input from keyboard if not input list provided
 
@@ -66,11 +75,19 @@ class InterpreterBase:
             return cur_input
         return None
 
+    # the next input as an int, for inputi(); an input source can parse it straight
+    # from its buffer
+    def get_int_input(self):
+        if self.input_source is not None:
+            return self.input_source.get_int()
+        return int(self.get_input())
+
     # students must call this for any errors that they run into
     def error(self, error_type, description=None, line_num=None):
         # log the error before we throw
         self.error_line = line_num
         self.error_type = error_type
+        self.flush_output()
 
         if description:
             description = ": " + description
@@ -81,12 +98,22 @@ class InterpreterBase:
         raise Exception(f"{error_type} on line {line_num}{description}")
 
     def output(self, v):
+        if self.output_sink is not None:
+            self.output_sink.write(v)
+            return
         if self.console_output:
             print(v)
         self.output_log.append(v)
 
+    # call when a run ends, so that a buffering output sink writes what it holds
+    def flush_output(self):
+        if self.output_sink is not None:
+            self.output_sink.flush()
+
     def get_output(self):
-        return self.output_log
+        if self.output_sink is None:
+            return self.output_log
+        return self.output_sink.get_output()
 
     def get_error_type_and_line(self):
         return self.error_type, self.error_line
@@ -2,14 +2,21 @@ import copy
 from enum import Enum
 
 from brewparse import parse_program
-from env_v3 import EnvironmentManager
+from closuresv3 import ClosureCompiler
+from env_v3 import EnvironmentManager, FrameEnvironmentManager
 from intbase import InterpreterBase, ErrorType
+from memov3 import MemoCache, PurityChecker
+from optimizerv3 import ConstantFolder, LoopInvariantHoister
+from profilerv3 import Profiler
+from resolverv3 import SlotResolver, split_name
+from typecheckv3 import TypeChecker
 from type_valuev3 import *
 
 
 class ExecStatus(Enum):
     CONTINUE = 1
     RETURN = 2
+    TAIL_CALL = 3  # the value is the (func_ast, args, type_safe) of the call to make
 
 
 # Main interpreter class
@@ -21,24 +28,112 @@ class Interpreter(InterpreterBase):
     BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
-        super().__init__(console_output, inp)
+    # compile_closures selects the closure-compiling engine (see closuresv3.py)
+    # instead of walking the AST on every execution
+    # resolve_slots stores variables in slot-indexed frames (see resolverv3.py);
+    # turn it off to fall back to the name-based EnvironmentManager
+    # ast_cache is an optional astcache.ASTCache used in place of parse_program
+    # static_types runs the TypeChecker (see typecheckv3.py) so that assignments, argument
+    # bindings and returns it proves type-safe skip their runtime checks
+    # profile records per-function and per-line counts and times in self.profiler
+    # (see profilerv3.py)
+    # tail_calls makes `return f(...);` reuse the caller's activation record for f, so
+    # that accumulator-style recursion runs in constant Python stack and environment space.
+    # It is on by default in the tree walker; the closure compiler always pushes a new
+    # record, so asking it for tail_calls=True is an error
+    # memo_size caches the results of up to that many calls to pure functions in
+    # self.memo (see memov3.py); calls answered from the cache aren't traced or profiled.
+    # Only the tree walker supports it, so it can't be combined with compile_closures
+    # output_sink and input_source are optional replacements for output_log and inp, from
+    # outputsinks.py and inputsources.py
+    # fold_constants runs the ConstantFolder (see optimizerv3.py) over the program first;
+    # self.constant_folder.nodes_eliminated then tells how many nodes it removed
+    # hoist_invariants has the tree walker compute loop-invariant expressions once per
+    # loop (see LoopInvariantHoister in optimizerv3.py); self.hoister then tells how many
+    # it found. Only the tree walker supports it, so it can't be combined with
+    # compile_closures
+    def __init__(self, console_output=True, inp=None, trace_output=False, compile_closures=False,
+                 resolve_slots=True, ast_cache=None, static_types=False, profile=False,
+                 tail_calls=None, memo_size=None, output_sink=None, input_source=None,
+                 fold_constants=False, hoist_invariants=False):
+        if hoist_invariants and compile_closures:
+            raise ValueError("hoist_invariants is only supported by the tree walker")
+        if memo_size and compile_closures:
+            raise ValueError("memo_size is only supported by the tree walker")
+        if tail_calls and compile_closures:
+            raise ValueError("tail_calls is only supported by the tree walker")
+        super().__init__(console_output, inp, output_sink, input_source)
+        self.fold_constants = fold_constants
+        self.constant_folder = None
+        self.hoist_invariants = hoist_invariants
+        self.hoister = None
         self.trace_output = trace_output
+        self.tail_calls = tail_calls is None or tail_calls
+        self.memo_size = memo_size
+        self.memo = None
+        self.compile_closures = compile_closures
+        self.resolve_slots = resolve_slots
+        self.ast_cache = ast_cache
+        self.static_types = static_types
+        self.profiler = Profiler() if profile else None
         self.__setup_ops()
         self.__call_stack = []
         self.type_manager = TypeManager()
-        self.env = EnvironmentManager()
+        if resolve_slots:
+            self.env = FrameEnvironmentManager()
+        else:
+            self.env = EnvironmentManager()
         self.func_name_to_ast = {}
 
     # run a program that's provided in a string
     # usese the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
     def run(self, program):
-        ast = parse_program(program)
+        if self.ast_cache is not None:
+            ast = self.ast_cache.parse_program(program)
+        else:
+            ast = parse_program(program)
+        if self.fold_constants:
+            self.constant_folder = ConstantFolder()
+            self.constant_folder.fold_program(ast)
+        if self.resolve_slots:
+            SlotResolver().resolve_program(ast)
         self.__set_up_struct_table(ast)
         self.__set_up_function_table(ast)
+        if self.static_types:
+            TypeChecker(self.type_manager, self.func_name_to_ast).check_program(ast)
+        if self.memo_size or self.hoist_invariants:
+            pure_functions = PurityChecker(self.func_name_to_ast).pure_functions()
+        if self.memo_size:
+            self.memo = MemoCache(self.memo_size, pure_functions)
+        if self.hoist_invariants:
+            self.hoister = LoopInvariantHoister(pure_functions, self.resolve_slots)
+            self.hoister.hoist_program(ast)
+        try:
+            self.run_main()
+        finally:
+            self.flush_output()
+
+    # runs main() once the struct and function tables are set up;
+    # alternative backends (e.g. the bytecode VM in interpreterv3_vm.py) override this
+    def run_main(self):
+        if self.compile_closures:
+            compiler = ClosureCompiler(self, **self.engine_helpers())
+            compiler.call_func("main", [])
+            return
         self.__call_func_aux("main", [])
 
+    # the tree walker's lookup, coercion and comparison rules, for other execution
+    # engines to share so that every engine reports the same errors
+    def engine_helpers(self):
+        return {
+            "get_func_by_name": self.__get_func_by_name,
+            "coerce": self.__coerce,
+            "compatible_for_assignment": self.__compatible_types_for_assignment,
+            "eval_compare": self.__eval_compare,
+            "eval_and_or": self.__eval_and_or,
+        }
+
     def __set_up_struct_table(self, ast):
         struct_asts = ast.get("structs")
         if struct_asts is None:
@@ -90,6 +185,18 @@ class Interpreter(InterpreterBase):
             )
         return candidate_funcs[num_params]
 
+    # the frame size to push for func_ast, with room for its loop-invariant temporaries
+    def __frame_size(self, func_ast):
+        if self.hoister is None:
+            return func_ast.get("frame_size")
+        return self.hoister.frame_size(func_ast)
+
+    # variables are keyed by slot index once the resolver has run, and by name otherwise
+    def env_key(self, node, name):
+        if self.resolve_slots:
+            return node.get("slot")
+        return name
+
     def __get_return_type_of_current_function(self):
       current_func = self.__call_stack[-1]
       return current_func.get("return_type")
@@ -99,8 +206,10 @@ class Interpreter(InterpreterBase):
         for statement in statements:
             if self.trace_output:
                 print(statement)
+            if self.profiler is not None:
+                self.profiler.count_line(statement.lineno)
             status, return_val = self.__run_statement(statement)
-            if status == ExecStatus.RETURN:
+            if status != ExecStatus.CONTINUE:
                 self.env.pop_block()
                 return (status, return_val)
 
@@ -128,9 +237,10 @@ class Interpreter(InterpreterBase):
     def __call_func(self, call_node):
         func_name = call_node.get("name")
         actual_args = call_node.get("args")
-        return self.__call_func_aux(func_name, actual_args)
+        return self.__call_func_aux(func_name, actual_args, call_node.get("safe_args"))
 
-    def __call_func_aux(self, func_name, actual_args):
+    # safe_args[i] is True if the TypeChecker proved argument i needs no check or coercion
+    def __call_func_aux(self, func_name, actual_args, safe_args=None):
         if func_name == "print":
             return self.__call_print(actual_args)
         if func_name == "inputi" or func_name == "inputs":
@@ -139,7 +249,6 @@ class Interpreter(InterpreterBase):
         func_ast = self.__get_func_by_name(func_name, len(actual_args))
         self.__call_stack.append(func_ast)
         formal_args = func_ast.get("args")
-        return_type = self.__get_return_type_of_current_function()
         if len(actual_args) != len(formal_args):
             super().error(
                 ErrorType.NAME_ERROR,
@@ -147,33 +256,97 @@ class Interpreter(InterpreterBase):
             )
 
         # first evaluate all of the actual parameters and associate them with the formal parameter names
+        # (this is __bind_args inlined, so that a Brewin call costs no extra Python frames)
+        args = {}
+        for i, (formal_ast, actual_ast) in enumerate(zip(formal_args, actual_args)):
+            result = copy.copy(self.__eval_expr(actual_ast))
+            arg_name = formal_ast.get("name")
+            arg_type = formal_ast.get("var_type")
+            if safe_args is None or not safe_args[i]:
+                if not self.__compatible_types_for_assignment(Variable(arg_type), result):
+                    super().error(
+                        ErrorType.TYPE_ERROR,
+                        f"Type mismatch on formal parameter {arg_name}"
+                    )
+                result = self.__coerce(arg_type, result)
+            args[self.env_key(formal_ast, arg_name)] = Variable(arg_type, result)
+
+        # a pure call whose result is memoized doesn't run the body at all
+        memo_key = None
+        if self.memo is not None:
+            memo_key = self.memo.key((func_name, len(actual_args)), args.values())
+            if memo_key is not None:
+                return_val = self.memo.get(memo_key)
+                if return_val is not None:
+                    self.__call_stack.pop()
+                    return return_val
+
+        # then create the new activation record 
+        self.env.push_func(self.__frame_size(func_ast))
+        # return types of the tail-calling functions whose checks and coercions still
+        # have to be applied to the value finally returned, innermost last; a repeated
+        # type is only recorded once, since checking it again would change nothing
+        pending_return_types = []
+        while True:
+            # add the formal arguments to the activation record
+            for arg_name, variable in args.items():
+              self.env.create(arg_name, variable)
+            if self.profiler is not None:
+                self.profiler.enter(func_ast)
+                try:
+                    exec_status, return_val = self.__run_statements(func_ast.get("statements"))
+                finally:
+                    self.profiler.leave()
+            else:
+                exec_status, return_val = self.__run_statements(func_ast.get("statements"))
+            if exec_status != ExecStatus.TAIL_CALL:
+                break
+            # the body ended in `return g(...);`, so run g in this activation record
+            callee_ast, args, type_safe = return_val
+            return_type = func_ast.get("return_type")
+            if not type_safe and return_type not in pending_return_types[-1:]:
+                pending_return_types.append(return_type)
+            self.env.replace_func(self.__frame_size(callee_ast))
+            self.__call_stack[-1] = callee_ast
+            func_ast = callee_ast
+        self.env.pop_func()
+        self.__call_stack.pop()
+        if exec_status != ExecStatus.RETURN:
+            return_val = self.type_manager.create_default_value(func_ast.get("return_type"))  # DOCUMENT no return statement returns default value
+        for return_type in reversed(pending_return_types):
+            return_val = self.__check_return_value(return_type, return_val)
+        if memo_key is not None:
+            self.memo.put(memo_key, return_val)
+        return return_val
+
+    # evaluates the actual parameters of a tail call in the caller's environment, and
+    # checks and coerces them to the types of the formal parameters, as __call_func_aux does
+    def __bind_args(self, func_ast, actual_args, safe_args):
+        formal_args = func_ast.get("args")
+        if len(actual_args) != len(formal_args):
+            super().error(
+                ErrorType.NAME_ERROR,
+                f"Function {func_ast.get('name')} with {len(actual_args)} args not found",
+            )
         args = {}
-        for formal_ast, actual_ast in zip(formal_args, actual_args):
+        for i, (formal_ast, actual_ast) in enumerate(zip(formal_args, actual_args)):
             result = copy.copy(self.__eval_expr(actual_ast))
             arg_name = formal_ast.get("name")
             arg_type = formal_ast.get("var_type")
+            if safe_args is not None and safe_args[i]:
+                args[self.env_key(formal_ast, arg_name)] = Variable(arg_type, result)
+                continue
             if not self.__compatible_types_for_assignment(Variable(arg_type), result):
                 super().error(
                     ErrorType.TYPE_ERROR,
                     f"Type mismatch on formal parameter {arg_name}"
                 )
-            args[arg_name] = Variable(arg_type, self.__coerce(arg_type, result))
-
-        # then create the new activation record 
-        self.env.push_func()
-        # and add the formal arguments to the activation record
-        for arg_name, variable in args.items():
-          self.env.create(arg_name, variable)
-        exec_status, return_val = self.__run_statements(func_ast.get("statements"))
-        self.env.pop_func()
-        self.__call_stack.pop()
-        if exec_status == ExecStatus.RETURN:
-            return return_val
-        return self.type_manager.create_default_value(return_type)  # DOCUMENT no return statement returns default value
+            args[self.env_key(formal_ast, arg_name)] = Variable(arg_type, self.__coerce(arg_type, result))
+        return args
 
     def __coerce(self, target_type, value_obj):
         if target_type == Type.BOOL and value_obj.type() == Type.INT:
-            return Value(Type.BOOL, bool(value_obj.value()))
+            return bool_value(value_obj.value())
         # We "coerce" nil when assigning it to an variable with declared structure type
         if self.type_manager.is_struct_type(target_type) and value_obj.type() == Type.NIL:
             return self.type_manager.create_default_value(target_type)
@@ -201,16 +374,18 @@ class Interpreter(InterpreterBase):
             super().error(
                 ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
             )
-        inp = super().get_input()
         if name == "inputi":
-            return Value(Type.INT, int(inp))
+            return int_value(super().get_int_input())
         if name == "inputs":
-            return Value(Type.STRING, inp)
+            return Value(Type.STRING, super().get_input())
 
     def __assign(self, assign_ast):
         var_name = assign_ast.get("name")
-        lhs_var = self.__get_variable(var_name)
+        lhs_var = self.__get_variable(var_name, assign_ast)
         rhs_val = self.__eval_expr(assign_ast.get("expression"))
+        if assign_ast.get("type_safe"):
+            lhs_var.set_value(rhs_val)
+            return
         if not self.__compatible_types_for_assignment(lhs_var, rhs_val): # DOCUMENT
             super().error(
                 ErrorType.TYPE_ERROR, f"Type mismatch {lhs_var.type()} vs {rhs_val.type()} in assignment"
@@ -224,31 +399,23 @@ class Interpreter(InterpreterBase):
 
         lhs_var.set_value(rhs_val)
 
-    def __get_variable(self, var_name):
-        split_var = var_name.split(".")
-        base_var = self.env.get(split_var[0])
+    # var_node is the AST node naming the variable; it carries the variable's slot, its
+    # pre-split path and, once a dotted path has been followed, the field offsets it takes
+    def __get_variable(self, var_name, var_node):
+        path = split_name(var_node)
+        base_var = self.env.get(self.env_key(var_node, path[0]))
         if base_var is None:
             super().error(
-                ErrorType.NAME_ERROR, f"Undefined variable {split_var[0]}"
+                ErrorType.NAME_ERROR, f"Undefined variable {path[0]}"
             )
-        while len(split_var) > 1:
-            val_type = base_var.value().type()
-            var_val = base_var.value().value()
-            if val_type == Type.NIL or (self.type_manager.is_struct_type(val_type) and var_val is None):
-                super().error(
-                    ErrorType.FAULT_ERROR, f"Error dereferencing nil value {split_var[0]} in {var_name}"
-                )
-            if not self.type_manager.is_struct_type(val_type):
-                super().error(
-                    ErrorType.TYPE_ERROR, f"Dot used with non-struct {base_var} in {var_name}"
-                )
-            split_var.pop(0)
-            base_var = var_val.get(split_var[0], None)  # var_val is a dictionary which implements the struct "field" -> Variable object
-            if base_var is None:
-                super().error(
-                    ErrorType.NAME_ERROR, f"Unknown member {split_var[0]} in {var_name}"
-                )
-
+        if len(path) == 1:
+            return base_var
+
+        offsets = var_node.get("offsets")
+        if offsets is not None:
+            return TypeManager.follow_field_offsets(base_var, offsets, path, super().error)
+        base_var, offsets = self.type_manager.resolve_field_path(base_var, path, super().error)
+        var_node.dict["offsets"] = offsets
         return base_var
     
     def __var_def(self, var_ast):
@@ -260,7 +427,7 @@ class Interpreter(InterpreterBase):
             super().error(
                 ErrorType.TYPE_ERROR, f"Unknown/invalid type specified {var_type}"
             )
-        if not self.env.create(var_name, variable):
+        if not self.env.create(self.env_key(var_ast, var_name), variable):
             super().error(
                 ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}"
             )
@@ -269,14 +436,16 @@ class Interpreter(InterpreterBase):
         if expr_ast.elem_type == InterpreterBase.NIL_NODE:
             return Interpreter.NIL_VALUE
         if expr_ast.elem_type == InterpreterBase.INT_NODE:
-            return Value(Type.INT, expr_ast.get("val"))
+            return literal_value(expr_ast)
         if expr_ast.elem_type == InterpreterBase.STRING_NODE:
-            return Value(Type.STRING, expr_ast.get("val"))
+            return literal_value(expr_ast)
         if expr_ast.elem_type == InterpreterBase.BOOL_NODE:
-            return Value(Type.BOOL, expr_ast.get("val"))
+            return literal_value(expr_ast)
+        if self.hoister is not None and expr_ast in self.hoister.temps:
+            return self.__eval_invariant(expr_ast)
         if expr_ast.elem_type == InterpreterBase.VAR_NODE:
             var_name = expr_ast.get("name")
-            variable = self.__get_variable(var_name)  # error checks
+            variable = self.__get_variable(var_name, expr_ast)  # error checks
             return variable.value()
         if expr_ast.elem_type == InterpreterBase.FCALL_NODE:
             return self.__call_func(expr_ast)
@@ -289,6 +458,21 @@ class Interpreter(InterpreterBase):
         if expr_ast.elem_type == Interpreter.NOT_NODE:
             return self.__eval_unary_not(expr_ast)
 
+    # the value of a loop-invariant expression, computed the first time it's needed
+    # after the loop that owns it started
+    def __eval_invariant(self, expr_ast):
+        temps = self.hoister.temps
+        key = temps[expr_ast]
+        temp = self.env.get(key)
+        if temp.value() is None:
+            # evaluate it as usual; a recursive call reaching it meanwhile does the same
+            del temps[expr_ast]
+            try:
+                temp.set_value(self.__eval_expr(expr_ast))
+            finally:
+                temps[expr_ast] = key
+        return temp.value()
+
     def __new_struct(self, new_ast):
         var_type = new_ast.get("var_type")
         default_value = self.type_manager.new_struct_value(var_type)
@@ -341,9 +525,9 @@ class Interpreter(InterpreterBase):
         obj2 = self.__coerce(Type.BOOL, obj2)
 
         if oper == "||":
-           return Value(Type.BOOL, obj1.value() or obj2.value()) 
+           return bool_value(obj1.value() or obj2.value()) 
 
-        return Value(Type.BOOL, obj1.value() and obj2.value())
+        return bool_value(obj1.value() and obj2.value())
 
     
     def __eval_compare(self, oper, obj1, obj2):
@@ -362,15 +546,15 @@ class Interpreter(InterpreterBase):
 
         # If the two types match, then just compare their values and get a result
         if type1 == type2:
-           return Value(Type.BOOL, cmp(obj1.value(), obj2.value()))  # DOCUMENT that we compare object references for structs
+           return bool_value(cmp(obj1.value(), obj2.value()))  # DOCUMENT that we compare object references for structs
 
         # Handle the case where we're comparing a valid struct to nil
         if Type.NIL in (type1, type2):
             # two literal nils already handled by the case above
             if self.type_manager.is_struct_type(type1):
-                return Value(Type.BOOL, cmp(obj1.value(), None))
+                return bool_value(cmp(obj1.value(), None))
             elif self.type_manager.is_struct_type(type2):
-                return Value(Type.BOOL, cmp(obj2.value(), None))
+                return bool_value(cmp(obj2.value(), None))
 
             # trying to compare some type other than a struct to nil; error
             super().error(
@@ -384,7 +568,7 @@ class Interpreter(InterpreterBase):
             if Type.INT in (type1, type2):
                 obj1 = self.__coerce(Type.BOOL, obj1)
                 obj2 = self.__coerce(Type.BOOL, obj2)
-                return Value(Type.BOOL, cmp(obj1.value(), obj2.value()))
+                return bool_value(cmp(obj1.value(), obj2.value()))
 
         super().error(
             ErrorType.TYPE_ERROR,
@@ -428,7 +612,7 @@ class Interpreter(InterpreterBase):
                 f"Incompatible type for {arith_ast.elem_type} operation",
             )
 
-        return Value(Type.INT, -value_obj.value())
+        return int_value(-value_obj.value())
     
     def __eval_unary_not(self, arith_ast):
         value_obj = self.__eval_expr(arith_ast.get("op1"))
@@ -440,43 +624,23 @@ class Interpreter(InterpreterBase):
                 f"Incompatible type for {arith_ast.elem_type} operation",
             )
 
-        notted = Value(Type.BOOL, not self.__coerce(Type.BOOL, value_obj).value())
+        notted = bool_value(not self.__coerce(Type.BOOL, value_obj).value())
         return notted
 
     def __setup_ops(self):
         self.op_to_lambda = {}
         # set up operations on integers
         self.op_to_lambda[Type.INT] = {}
-        self.op_to_lambda[Type.INT]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
-        )
-        self.op_to_lambda[Type.INT]["-"] = lambda x, y: Value(
-            x.type(), x.value() - y.value()
-        )
-        self.op_to_lambda[Type.INT]["*"] = lambda x, y: Value(
-            x.type(), x.value() * y.value()
-        )
-        self.op_to_lambda[Type.INT]["/"] = lambda x, y: Value(
-            x.type(), x.value() // y.value()
-        )
-        self.op_to_lambda[Type.INT]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
-        )
-        self.op_to_lambda[Type.INT]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
-        )
-        self.op_to_lambda[Type.INT]["<"] = lambda x, y: Value(
-            Type.BOOL, x.value() < y.value()
-        )
-        self.op_to_lambda[Type.INT]["<="] = lambda x, y: Value(
-            Type.BOOL, x.value() <= y.value()
-        )
-        self.op_to_lambda[Type.INT][">"] = lambda x, y: Value(
-            Type.BOOL, x.value() > y.value()
-        )
-        self.op_to_lambda[Type.INT][">="] = lambda x, y: Value(
-            Type.BOOL, x.value() >= y.value()
-        )
+        self.op_to_lambda[Type.INT]["+"] = lambda x, y: int_value(x.value() + y.value())
+        self.op_to_lambda[Type.INT]["-"] = lambda x, y: int_value(x.value() - y.value())
+        self.op_to_lambda[Type.INT]["*"] = lambda x, y: int_value(x.value() * y.value())
+        self.op_to_lambda[Type.INT]["/"] = lambda x, y: int_value(x.value() // y.value())
+        self.op_to_lambda[Type.INT]["=="] = lambda x, y: bool_value(x.type() == y.type() and x.value() == y.value())
+        self.op_to_lambda[Type.INT]["!="] = lambda x, y: bool_value(x.type() != y.type() or x.value() != y.value())
+        self.op_to_lambda[Type.INT]["<"] = lambda x, y: bool_value(x.value() < y.value())
+        self.op_to_lambda[Type.INT]["<="] = lambda x, y: bool_value(x.value() <= y.value())
+        self.op_to_lambda[Type.INT][">"] = lambda x, y: bool_value(x.value() > y.value())
+        self.op_to_lambda[Type.INT][">="] = lambda x, y: bool_value(x.value() >= y.value())
         #  set up operations on strings
         self.op_to_lambda[Type.STRING] = {}
         self.op_to_lambda[Type.STRING]["+"] = lambda x, y: Value(
@@ -511,6 +675,8 @@ class Interpreter(InterpreterBase):
         init_ast = for_ast.get("init") 
         cond_ast = for_ast.get("condition")
         update_ast = for_ast.get("update") 
+        if self.hoister is not None:
+            self.__clear_invariants(self.hoister.loop_temps.get(for_ast, ()))
 
         self.__run_statement(init_ast)  # initialize counter variable
         run_for = Interpreter.TRUE_VALUE
@@ -524,19 +690,46 @@ class Interpreter(InterpreterBase):
             if run_for.value():
                 statements = for_ast.get("statements")
                 status, return_val = self.__run_statements(statements)
-                if status == ExecStatus.RETURN:
+                if status != ExecStatus.CONTINUE:
                     return status, return_val
 
                 self.__run_statement(update_ast)  # update counter variable
 
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
+    # empties the temporaries of the invariant expressions owned by a loop that's starting
+    def __clear_invariants(self, keys):
+        for key in keys:
+            if not self.env.create(key, Variable(None)):
+                self.env.set(key, Variable(None))
+
     def __do_return(self, return_ast):
         expr_ast = return_ast.get("expression")
         func_ret_type = self.__get_return_type_of_current_function()
         if expr_ast is None:
             return (ExecStatus.RETURN, self.type_manager.create_default_value(func_ret_type)) # DOCUMENT return; as returning default value
+        if self.tail_calls and expr_ast.elem_type == InterpreterBase.FCALL_NODE:
+            tail_call = self.__prepare_tail_call(expr_ast, return_ast.get("type_safe"))
+            if tail_call is not None:
+                return (ExecStatus.TAIL_CALL, tail_call)
         value_obj = copy.copy(self.__eval_expr(expr_ast))  # DOCUMENT
+        if return_ast.get("type_safe"):
+            return (ExecStatus.RETURN, value_obj)
+        return (ExecStatus.RETURN, self.__check_return_value(func_ret_type, value_obj))
+
+    # looks up the function a `return f(...);` calls and binds its arguments, doing
+    # everything __call_func_aux does before it pushes an activation record; returns
+    # None for built-in functions, which are just called
+    def __prepare_tail_call(self, call_ast, type_safe):
+        func_name = call_ast.get("name")
+        if func_name in ("print", "inputi", "inputs"):
+            return None
+        actual_args = call_ast.get("args")
+        func_ast = self.__get_func_by_name(func_name, len(actual_args))
+        args = self.__bind_args(func_ast, actual_args, call_ast.get("safe_args"))
+        return (func_ast, args, type_safe)
+
+    def __check_return_value(self, func_ret_type, value_obj):
         if value_obj.type() == Type.VOID:
             super().error(
                 ErrorType.TYPE_ERROR,
@@ -547,4 +740,4 @@ class Interpreter(InterpreterBase):
                 ErrorType.TYPE_ERROR,
                 f"Returned value's type {value_obj.type()} is inconsistent with function's return type {func_ret_type}"
             )
-        return (ExecStatus.RETURN, self.__coerce(func_ret_type, value_obj)) # DOCUMENT all coercions!
+        return self.__coerce(func_ret_type, value_obj) # DOCUMENT all coercions!
@@ -0,0 +1,37 @@
+import interpreterv3
+from bytecodev3 import BytecodeCompiler, VM, DEFAULT_MAX_STACK_BYTES
+
+
+# Runs v3 Brewin programs on the bytecode VM in bytecodev3.py instead of walking the AST.
+# Parsing, struct/function table setup and all error checks are shared with interpreterv3.
+# Calls don't use the Python stack, so recursion is bounded only by max_stack_bytes
+# (see bytecodev3.VM), not by sys.getrecursionlimit().
+class Interpreter(interpreterv3.Interpreter):
+    def __init__(self, console_output=True, inp=None, trace_output=False, ast_cache=None,
+                 max_stack_bytes=DEFAULT_MAX_STACK_BYTES, output_sink=None, input_source=None,
+                 fold_constants=False):
+        # the compiler relies on the slots assigned by the resolver
+        super().__init__(console_output, inp, trace_output, resolve_slots=True, ast_cache=ast_cache,
+                         output_sink=output_sink, input_source=input_source, fold_constants=fold_constants)
+        self.max_stack_bytes = max_stack_bytes
+        self.code_objects = {}
+
+    def run_main(self):
+        self.code_objects = BytecodeCompiler(self).compile_program()
+        main_code = self.code_objects.get(("main", 0))
+        if main_code is None:
+            super().run_main()  # report the missing main() exactly as the tree walker does
+            return
+        VM(self, max_stack_bytes=self.max_stack_bytes, **self.engine_helpers()).execute(main_code)
+
+
+def main():
+    interpreter = Interpreter()
+
+    with open('./test.br', 'r') as f:
+        program = f.read()
+
+    interpreter.run(program)
+
+if __name__ == '__main__':
+    main()
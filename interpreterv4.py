@@ -1,19 +1,61 @@
-import copy
-
 from intbase import InterpreterBase, ErrorType
 from brewparse import parse_program
 from element import Element
 
+# Carries a raised Brewin exception up to the nearest enclosing try. Anything that
+# pushes scopes and catches it must put self.vars back to its own depth.
+class BrewinException(Exception):
+    def __init__(self, exception_type):
+        super().__init__(exception_type)
+        self.exception_type = exception_type
+
+# A deferred expression. Variables hold either a literal/nil AST node or a Thunk.
+# A Thunk points at the (shared, never modified) AST node for the expression and
+# captures the deferred values of its operands or arguments at the time it was
+# created, which is all the environment it needs. The result of the first force is
+# cached and the captures are dropped; a force that raises is not cached.
+class Thunk:
+    __slots__ = ('expr', 'operands', 'value', 'forced')
+
+    def __init__(self, expr, operands):
+        self.expr = expr
+        self.operands = operands
+        self.value = None
+        self.forced = False
+
+    # only an int, string or bool result is kept; like a deferred node that was never
+    # rewritten with a value, a thunk giving nil (e.g. a call to a void function) runs
+    # again, side effects included, every time it is forced
+    def force(self, interpreter):
+        if self.forced: return self.value, None
+        res, ret = interpreter.run_thunk(self.expr, self.operands)
+        if type(res) in (int, str, bool):
+            self.value, self.forced = res, True
+            self.expr = self.operands = None
+        return res, None
+
 class Interpreter(InterpreterBase):
-    def __init__(self, console_output=True, inp=None, trace_output=False):
-        super().__init__(console_output, inp)
+    # ast_cache is an optional astcache.ASTCache used in place of parse_program
+    # output_sink and input_source are optional replacements for output_log and inp, from
+    # outputsinks.py and inputsources.py
+    def __init__(self, console_output=True, inp=None, trace_output=False, ast_cache=None, output_sink=None,
+                 input_source=None):
+        super().__init__(console_output, inp, output_sink, input_source)
+        self.ast_cache = ast_cache
 
         self.funcs = {} # {(name,n_args):element,}
         self.vars = [] # [({name:val,},bool),]
         self.bops = {'+', '-', '*', '/', '==', '!=', '>', '>=', '<', '<=', '||', '&&'}
+        self.handlers = {} # {try element:{exception_type:statements,},}, for the current run
 
+    # running never modifies the AST (deferred results live in Thunks), so a tree from
+    # the cache can be run any number of times, by any number of interpreters at once
     def run(self, program):
-        ast = parse_program(program)
+        if self.ast_cache is not None:
+            ast = self.ast_cache.parse_program(program)
+        else:
+            ast = parse_program(program)
+        self.handlers = {}
 
         for func in ast.get('functions'):
             self.funcs[(func.get('name'),len(func.get('args')))] = func
@@ -28,8 +70,12 @@ class Interpreter(InterpreterBase):
         if main_key is None:
             super().error(ErrorType.NAME_ERROR, '')
 
-        _, ret = self.run_fcall(self.funcs[main_key], eager=False)
-        if type(ret) == str: super().error(ErrorType.FAULT_ERROR, 'exception not caught')
+        try:
+            self.run_fcall(self.funcs[main_key], eager=False)
+        except BrewinException:
+            super().error(ErrorType.FAULT_ERROR, 'exception not caught')
+        finally:
+            self.flush_output()
 
     def run_vardef(self, statement):
         name = statement.get('name')
@@ -57,8 +103,10 @@ class Interpreter(InterpreterBase):
 
         super().error(ErrorType.NAME_ERROR, '')
 
-    def run_fcall(self, statement, eager):
-        fcall_name, args = statement.get('name'), statement.get('args')
+    # args are the call's argument AST nodes, or the deferred values captured by a Thunk
+    def run_fcall(self, statement, eager, args=None):
+        fcall_name = statement.get('name')
+        if args is None: args = statement.get('args')
 
         res, ret = None, None
 
@@ -67,21 +115,19 @@ class Interpreter(InterpreterBase):
                 super().error(ErrorType.NAME_ERROR, '')
 
             if args:
-                res, ret = self.run_expr(args[0], eager=True) # SHOUDL THIS BE EAGER EVALUATION?
-                if type(ret) == str: return res, ret
+                res, ret = self.force(args[0]) # SHOUDL THIS BE EAGER EVALUATION?
                 super().output(str(res))
 
-            res = super().get_input()
-
-            return (int(res), None) if fcall_name == 'inputi' else (res, None)
+            if fcall_name == 'inputi':
+                return (super().get_int_input(), None)
+            return (super().get_input(), None)
 
         if fcall_name == 'print':
             
             out = ''
 
             for arg in args:
-                c_out, ret = self.run_expr(arg, eager=True)
-                if type(ret) == str: return c_out, ret
+                c_out, ret = self.force(arg)
                 if type(c_out) == bool: out += str(c_out).lower()
                 else: out += str(c_out)
             super().output(out)
@@ -96,8 +142,7 @@ class Interpreter(InterpreterBase):
         template_args = [a.get('name') for a in func_def.get('args')]
         passed_args = []
         for a in args:
-            res, ret = self.run_expr(a, eager=False) # use lazy evaluation instead of eager evaluation
-            if type(ret) == str: return res, ret
+            res, ret = self.delay(a) # use lazy evaluation instead of eager evaluation
             passed_args.append(res)
 
         self.vars.append(({k:v for k,v in zip(template_args, passed_args)}, True, template_args))
@@ -107,7 +152,6 @@ class Interpreter(InterpreterBase):
 
     def run_if(self, statement, eager):
         cond, ret = self.run_expr(statement.get('condition'), eager=True) # should be eager evaluation
-        if type(ret) == str: return cond, ret
 
         if type(cond) != bool:
             super().error(ErrorType.TYPE_ERROR, '')
@@ -128,41 +172,61 @@ class Interpreter(InterpreterBase):
     def run_for(self, statement, eager):
         res, ret = None, False
 
-        _, rai = self.run_assign(statement.get('init'))
-        if type(rai) == str: return _, rai
+        raised = None
+        self.run_assign(statement.get('init'))
 
         while True:
-            cond, rai = self.run_expr(statement.get('condition'), eager=True) # should be eager evaluation
-            if type(rai) == str: return res, rai
+            cond, _ = self.run_expr(statement.get('condition'), eager=True) # should be eager evaluation
 
             if type(cond) != bool:
                 super().error(ErrorType.TYPE_ERROR, '')
 
             if ret == True or not cond: break
 
+            # a raise only ends the current pass through the body; it leaves the loop
+            # if it came from the last pass
             self.vars.append(({}, False, []))
-            res, ret = self.run_statements(statement.get('statements'), eager=eager)
+            depth = len(self.vars)
+            try:
+                res, ret = self.run_statements(statement.get('statements'), eager=eager)
+                raised = None
+            except BrewinException as e:
+                del self.vars[depth:]
+                res, ret, raised = None, None, e
             self.vars.pop()
 
-            _, rai = self.run_assign(statement.get('update')) # should be lazy evaluation
-            if type(rai) == str: return _, rai
+            self.run_assign(statement.get('update')) # should be lazy evaluation
 
+        if raised is not None: raise raised
         return res, ret
     
     def run_try(self, statement, eager):
-        res, ret = None, False
+        depth = len(self.vars)
+        self.vars.append(({}, False, []))
+        try:
+            res, ret = self.run_statements(statement.get('statements'), eager=eager)
+            self.vars.pop()
+            return res, ret
+        except BrewinException as e:
+            del self.vars[depth:]
+            handler = self.catchers(statement).get(e.exception_type)
+            if handler is None: raise
         self.vars.append(({}, False, []))
-        res, ret = self.run_statements(statement.get('statements'), eager=eager)
+        res, ret = self.run_statements(handler, eager=eager)
         self.vars.pop()
-        if type(ret) != str: return res, ret
-        for catcher in statement.get('catchers'):
-            if catcher.get('exception_type') == ret:
-                self.vars.append(({}, False, []))
-                res, ret = self.run_statements(catcher.get('statements'), eager=eager)
-                self.vars.pop()
-                break
         return res, ret
 
+    # exception type -> statements of the first catch for it; the AST isn't modified,
+    # so the table is kept here, keyed by the try element
+    def catchers(self, statement):
+        handlers = self.handlers.get(statement)
+        if handlers is None:
+            handlers = {}
+            for catcher in statement.get('catchers'):
+                handlers.setdefault(catcher.get('exception_type'), catcher.get('statements'))
+            self.handlers[statement] = handlers
+        return handlers
+
     def run_return(self, statement, eager):
         expr = statement.get('expression')
         # According to spec, the expressions in return statements are evaluated lazily.
@@ -172,13 +236,12 @@ class Interpreter(InterpreterBase):
     
     def run_raise(self, statement):
         expr = statement.get('exception_type')
-        res, ret = self.run_expr(expr, eager=True) # should be eager evaluation
-        if type(ret) == str: return res, ret # case where exception_type is a raise
-        if type(res) == str: return None, res # case where exception_type is a string
+        res, _ = self.run_expr(expr, eager=True) # should be eager evaluation
+        if type(res) == str: raise BrewinException(res)
         super().error(ErrorType.TYPE_ERROR, '')
 
     def run_statements(self, statements, eager=True):
-        res, ret = None, False # do i need to add raise here?
+        res, ret = None, False
 
         for statement in statements:
             kind = statement.elem_type
@@ -197,32 +260,31 @@ class Interpreter(InterpreterBase):
             elif kind == 'try':
                 res, ret = self.run_try(statement, eager=eager)
             elif kind == 'return':
-                res, rai = self.run_return(statement, eager=eager) # fix this?
-                if type(rai) == str: return res, rai
+                res, _ = self.run_return(statement, eager=eager)
                 ret = True
             elif kind == 'raise':
-                res, ret = self.run_raise(statement) # fix this?
+                self.run_raise(statement)
 
-            if ret == True or type(ret) == str: break
+            if ret == True: break
 
         return res, ret
     
-    def modify(self, expr, res_ret):
-        res, ret = res_ret
-        if hasattr(expr, 'varRef'):
-            res_type = type(res)
-            expr.dict['val'] = res
-            if res_type == int:
-                expr.elem_type = 'int'
-            elif res_type == str:
-                expr.elem_type = 'string'
-            elif res_type == bool:
-                expr.elem_type = 'bool'
-        return res_ret
-        # expr.dict.pop('op1', None)
-        # expr.dict.pop('op2', None)
-        # expr.dict.pop('args', None)
-        # expr.dict.pop('name', None)
+    # eagerly evaluates an AST node or a deferred value
+    def force(self, expr):
+        if type(expr) == Thunk: return expr.force(self)
+        return self.run_expr(expr, eager=True)
+
+    # defers an AST node; deferred values are already deferred
+    def delay(self, expr):
+        if type(expr) == Thunk: return expr, None
+        return self.run_expr(expr, eager=False)
+
+    def run_thunk(self, expr, operands):
+        kind = expr.elem_type
+        if kind == 'var': return self.run_expr(expr, eager=True) # name was unbound when deferred
+        if kind == 'fcall': return self.run_fcall(expr, eager=True, args=operands)
+        if kind in self.bops: return self.run_op(kind, operands[0], operands[1])
+        return self.run_unary(kind, operands[0])
 
     def run_expr(self, expr, eager):
         if expr == None: return None, None
@@ -246,93 +308,80 @@ class Interpreter(InterpreterBase):
 
             for scope_vars, is_func, _ in self.vars[::-1]:
                 if var_name in scope_vars:
-                    scope_vars[var_name].varRef = True
                     if eager == False: return scope_vars[var_name], ret
-                    return self.modify(scope_vars[var_name], self.run_expr(scope_vars[var_name], eager=True))
+                    return self.force(scope_vars[var_name])
 
                 if is_func: break
 
             if eager == False:
-                return expr, None
+                return Thunk(expr, ()), None
 
             super().error(ErrorType.NAME_ERROR, '')
 
         elif kind == 'fcall':
             if eager == False:
-                new_expr = copy.deepcopy(expr) 
-                argList = new_expr.dict['args']
-                for i in range(len(argList)): argList[i] = self.run_expr(argList[i], eager=False)[0] # we can do res, ret but ret should always be None right?
-                return new_expr, ret
-            return self.modify(expr, self.run_fcall(expr, eager=True))
+                return Thunk(expr, [self.delay(a)[0] for a in expr.get('args')]), ret
+            return self.run_fcall(expr, eager=True)
 
         elif kind in self.bops:
+            if eager == False:
+                return Thunk(expr, (self.delay(expr.get('op1'))[0], self.delay(expr.get('op2'))[0])), ret
+            return self.run_op(kind, expr.get('op1'), expr.get('op2'))
 
+        elif kind == 'neg' or kind == '!':
             if eager == False:
-                new_expr = copy.deepcopy(expr)
-                new_expr.dict['op1'] = self.run_expr(new_expr.dict['op1'], eager=False)[0]
-                new_expr.dict['op2'] = self.run_expr(new_expr.dict['op2'], eager=False)[0]
-                return new_expr, ret
-
-            if kind == '&&' or kind == '||': # short circuit
-                l, ret = self.run_expr(expr.get('op1'), eager=True)
-                if type(ret) == str: return None, ret
-                tl = type(l)
-                if tl == bool:
-                    if kind == '&&' and not l: return self.modify(expr, (False, False))
-                    if kind == '||' and l: return self.modify(expr, (True, False))
-                    r, ret = self.run_expr(expr.get('op2'), eager=True) # l doesn't matter now
-                    tr = type(r)
-                    if tr == bool: return self.modify(expr, (r, ret))
-                super().error(ErrorType.TYPE_ERROR, '&& or || wrong type')
-
-            l, ret = self.run_expr(expr.get('op1'), eager=True)
-            # eagerness should propogate
-            if type(ret) == str: return l, ret
-            r, ret = self.run_expr(expr.get('op2'), eager=True)
-            if type(ret) == str: return r, ret
-            tl, tr = type(l), type(r)
-
-            # ret has to be False now
-
-            if kind == '==': return self.modify(expr, (tl == tr and l == r, False))
-            if kind == '!=': return self.modify(expr, (not (tl == tr and l == r), False))
-
-            if tl == str and tr == str:
-                if kind == '+': return self.modify(expr, (l + r, False))
-
-            if tl == int and tr == int:
-                if kind == '+': return self.modify(expr, (l + r, False))
-                if kind == '-': return self.modify(expr, (l - r, False))
-                if kind == '*': return self.modify(expr, (l * r, False))
-                if kind == '/': return (None, "div0") if r == 0 else self.modify(expr, (l // r, False))
-                if kind == '<': return self.modify(expr, (l < r, False))
-                if kind == '<=': return self.modify(expr, (l <= r, False))
-                if kind == '>': return self.modify(expr, (l > r, False))
-                if kind == '>=': return self.modify(expr, (l >= r, False))
+                return Thunk(expr, (self.delay(expr.get('op1'))[0],)), ret
+            return self.run_unary(kind, expr.get('op1'))
 
-            super().error(ErrorType.TYPE_ERROR, '')
+        return None, None
 
-        elif kind == 'neg':
-            if eager == False:
-                new_expr = copy.deepcopy(expr)
-                new_expr.dict['op1'] = self.run_expr(new_expr.dict['op1'], eager=False)[0]
-                return new_expr, ret
-            o, ret = self.run_expr(expr.get('op1'), eager=True)
-            if type(o) == int or type(ret) == str: return self.modify(expr, (-o, ret))
-            
-            super().error(ErrorType.TYPE_ERROR, '')
+    # op1 and op2 are AST nodes or deferred values
+    def run_op(self, kind, op1, op2):
+        if kind == '&&' or kind == '||': # short circuit
+            l, ret = self.force(op1)
+            tl = type(l)
+            if tl == bool:
+                if kind == '&&' and not l: return False, False
+                if kind == '||' and l: return True, False
+                r, ret = self.force(op2) # l doesn't matter now
+                tr = type(r)
+                if tr == bool: return r, ret
+            super().error(ErrorType.TYPE_ERROR, '&& or || wrong type')
+
+        l, ret = self.force(op1)
+        # eagerness should propogate
+        r, ret = self.force(op2)
+        tl, tr = type(l), type(r)
 
-        elif kind == '!':
-            if eager == False:
-                new_expr = copy.deepcopy(expr)
-                new_expr.dict['op1'] = self.run_expr(new_expr.dict['op1'], eager=False)[0]
-                return new_expr, ret
-            o, ret = self.run_expr(expr.get('op1'), eager=True)
-            if type(o) == bool or type(ret) == str: return self.modify(expr, (not o, ret))
+        # ret has to be False now
 
-            super().error(ErrorType.TYPE_ERROR, '')
+        if kind == '==': return tl == tr and l == r, False
+        if kind == '!=': return not (tl == tr and l == r), False
 
-        return None, None
+        if tl == str and tr == str:
+            if kind == '+': return l + r, False
+
+        if tl == int and tr == int:
+            if kind == '+': return l + r, False
+            if kind == '-': return l - r, False
+            if kind == '*': return l * r, False
+            if kind == '/':
+                if r == 0: raise BrewinException('div0')
+                return l // r, False
+            if kind == '<': return l < r, False
+            if kind == '<=': return l <= r, False
+            if kind == '>': return l > r, False
+            if kind == '>=': return l >= r, False
+
+        super().error(ErrorType.TYPE_ERROR, '')
+
+    def run_unary(self, kind, op1):
+        o, ret = self.force(op1)
+        if kind == 'neg':
+            if type(o) == int: return -o, ret
+        elif type(o) == bool: return not o, ret
+
+        super().error(ErrorType.TYPE_ERROR, '')
 
 def main():
     interpreter = Interpreter()
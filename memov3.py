@@ -0,0 +1,132 @@
+# Memoization of pure v3 Brewin functions.
+#
+# PurityChecker finds the functions whose result depends only on their arguments and
+# which have no effect other than returning it: every formal parameter, local variable
+# and the return type are int, bool or string; they never print, read input, create a
+# struct or touch a struct field; and every function they call is pure too. Such a call
+# can be answered from an earlier one with the same argument values. A call that fails
+# is never cached, so it fails again, the same way, every time it is made.
+#
+# MemoCache holds the results, keyed by function and argument values, evicting the
+# least recently used entry once it is full.
+
+from collections import OrderedDict
+
+from intbase import InterpreterBase
+from type_valuev3 import Type
+
+
+class PurityChecker:
+    VALUE_TYPES = {Type.INT, Type.BOOL, Type.STRING}
+    IMPURE_BUILTINS = {"print", "inputi", "inputs"}
+
+    def __init__(self, func_name_to_ast):
+        self.func_name_to_ast = func_name_to_ast
+        self.callees = set()  # (name, num args) called by the function being checked
+
+    # returns the set of (name, num args) of the pure functions
+    def pure_functions(self):
+        candidates = {}  # (name, num args) -> functions it calls
+        for name, by_arity in self.func_name_to_ast.items():
+            for num_args, func_ast in by_arity.items():
+                self.callees = set()
+                if self.__locally_pure(func_ast):
+                    candidates[(name, num_args)] = self.callees
+        # a function stays pure only while everything it calls is; drop the rest until
+        # nothing changes (functions calling each other in a cycle stay pure together)
+        pure = set(candidates)
+        changed = True
+        while changed:
+            changed = False
+            for key in list(pure):
+                if not candidates[key] <= pure:
+                    pure.discard(key)
+                    changed = True
+        return pure
+
+    def __locally_pure(self, func_ast):
+        if func_ast.get("return_type") not in self.VALUE_TYPES:
+            return False
+        for formal_ast in func_ast.get("args"):
+            if formal_ast.get("var_type") not in self.VALUE_TYPES:
+                return False
+        return self.__pure_statements(func_ast.get("statements"))
+
+    def __pure_statements(self, statements):
+        return statements is None or all(self.__pure_statement(s) for s in statements)
+
+    def __pure_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.VAR_DEF_NODE:
+            return statement.get("var_type") in self.VALUE_TYPES
+        if kind == "=":
+            return "." not in statement.get("name") and self.__pure_expr(statement.get("expression"))
+        if kind == InterpreterBase.RETURN_NODE:
+            expr_ast = statement.get("expression")
+            return expr_ast is None or self.__pure_expr(expr_ast)
+        if kind == InterpreterBase.IF_NODE:
+            return (
+                self.__pure_expr(statement.get("condition"))
+                and self.__pure_statements(statement.get("statements"))
+                and self.__pure_statements(statement.get("else_statements"))
+            )
+        if kind == InterpreterBase.FOR_NODE:
+            return (
+                self.__pure_statement(statement.get("init"))
+                and self.__pure_expr(statement.get("condition"))
+                and self.__pure_statement(statement.get("update"))
+                and self.__pure_statements(statement.get("statements"))
+            )
+        return self.__pure_expr(statement)
+
+    def __pure_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind in (InterpreterBase.INT_NODE, InterpreterBase.STRING_NODE, InterpreterBase.BOOL_NODE,
+                    InterpreterBase.NIL_NODE):
+            return True
+        if kind == InterpreterBase.VAR_NODE:
+            return "." not in expr_ast.get("name")
+        if kind == InterpreterBase.FCALL_NODE:
+            name = expr_ast.get("name")
+            args = expr_ast.get("args")
+            if name in self.IMPURE_BUILTINS or len(args) not in self.func_name_to_ast.get(name, {}):
+                return False
+            self.callees.add((name, len(args)))
+            return all(self.__pure_expr(arg) for arg in args)
+        if kind in (InterpreterBase.NEG_NODE, InterpreterBase.NOT_NODE):
+            return self.__pure_expr(expr_ast.get("op1"))
+        op2 = expr_ast.get("op2")
+        if op2 is not None:
+            return self.__pure_expr(expr_ast.get("op1")) and self.__pure_expr(op2)
+        return False  # new, or anything unknown
+
+
+class MemoCache:
+    def __init__(self, max_size, pure_functions):
+        self.max_size = max_size
+        self.pure_functions = pure_functions
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # the cache key for calling the function (name, num args) with args, a list of the
+    # bound argument Variables, or None if the function isn't pure
+    def key(self, func_key, args):
+        if func_key not in self.pure_functions:
+            return None
+        return (func_key, tuple((var.value().type(), var.value().value()) for var in args))
+
+    # returns the cached result, or None
+    def get(self, key):
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.results[key] = result
+        if len(self.results) > self.max_size:
+            self.results.popitem(last=False)
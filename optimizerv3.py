@@ -0,0 +1,346 @@
+# AST optimization passes for v3 programs. They never change a program's output or the
+# errors it reports.
+#
+# The ConstantFolder rewrites the tree parse_program returns in place, before the
+# resolver and type checker see it. It replaces operators whose operands are all
+# literals with the literal they evaluate to, following the interpreter's rules: / is
+# integer division, && and || coerce ints to bools (and, like every operator, always
+# evaluate both operands), and == and != coerce between int and bool. Anything that
+# would fail at runtime, such as a division by zero or an operator applied to the wrong
+# types, is left for the interpreter to report when (and only if) it runs.
+#
+# It also removes the branches of ifs whose condition is a literal and which can never
+# run. When the branch that always runs defines no variables of its own, its statements
+# replace the if; otherwise the if stays, with only that branch, so it keeps its scope.
+
+from element import Element
+from intbase import InterpreterBase
+
+INT = InterpreterBase.INT_NODE
+BOOL = InterpreterBase.BOOL_NODE
+STRING = InterpreterBase.STRING_NODE
+NIL = InterpreterBase.NIL_NODE
+LITERALS = {INT, BOOL, STRING, NIL}
+
+INT_OPS = {
+    "+": lambda x, y: x + y,
+    "-": lambda x, y: x - y,
+    "*": lambda x, y: x * y,
+    "/": lambda x, y: x // y,
+}
+INT_COMPARISONS = {
+    "==": lambda x, y: x == y,
+    "!=": lambda x, y: x != y,
+    "<": lambda x, y: x < y,
+    "<=": lambda x, y: x <= y,
+    ">": lambda x, y: x > y,
+    ">=": lambda x, y: x >= y,
+}
+BIN_OPS = set(INT_OPS) | set(INT_COMPARISONS) | {"&&", "||"}
+
+
+# the number of Elements in the tree rooted at node
+def count_nodes(node):
+    count = 1
+    for value in node.dict.values():
+        if isinstance(value, Element):
+            count += count_nodes(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, Element):
+                    count += count_nodes(item)
+    return count
+
+
+def literal_node(elem_type, val, lineno):
+    node = Element(elem_type, val=val)
+    node.lineno = lineno
+    return node
+
+
+class ConstantFolder:
+    def __init__(self):
+        self.nodes_eliminated = 0
+
+    def fold_program(self, ast):
+        before = count_nodes(ast)
+        for func_ast in ast.get("functions"):
+            func_ast.dict["statements"] = self.__fold_statements(func_ast.get("statements"))
+        self.nodes_eliminated += before - count_nodes(ast)
+
+    def __fold_statements(self, statements):
+        folded = []
+        for statement in statements:
+            kind = statement.elem_type
+            if kind == "=":
+                self.__fold_assign(statement)
+            elif kind == InterpreterBase.FCALL_NODE:
+                self.__fold_expr(statement)
+            elif kind == InterpreterBase.RETURN_NODE:
+                if statement.get("expression") is not None:
+                    statement.dict["expression"] = self.__fold_expr(statement.get("expression"))
+            elif kind == InterpreterBase.FOR_NODE:
+                self.__fold_assign(statement.get("init"))
+                statement.dict["condition"] = self.__fold_expr(statement.get("condition"))
+                self.__fold_assign(statement.get("update"))
+                statement.dict["statements"] = self.__fold_statements(statement.get("statements"))
+            elif kind == InterpreterBase.IF_NODE:
+                folded.extend(self.__fold_if(statement))
+                continue
+            folded.append(statement)
+        return folded
+
+    def __fold_assign(self, assign_ast):
+        assign_ast.dict["expression"] = self.__fold_expr(assign_ast.get("expression"))
+
+    # returns the statements that replace if_ast
+    def __fold_if(self, if_ast):
+        condition = self.__fold_expr(if_ast.get("condition"))
+        if_ast.dict["condition"] = condition
+        if_ast.dict["statements"] = self.__fold_statements(if_ast.get("statements"))
+        if if_ast.get("else_statements") is not None:
+            if_ast.dict["else_statements"] = self.__fold_statements(if_ast.get("else_statements"))
+        if condition.elem_type != INT and condition.elem_type != BOOL:
+            return [if_ast]
+        branch = if_ast.get("statements") if condition.get("val") else if_ast.get("else_statements")
+        if branch is None:
+            return []
+        if all(s.elem_type != InterpreterBase.VAR_DEF_NODE for s in branch):
+            return branch
+        if not condition.get("val"):
+            if_ast.dict["condition"] = literal_node(BOOL, True, condition.lineno)
+            if_ast.dict["statements"] = branch
+        if_ast.dict["else_statements"] = None
+        return [if_ast]
+
+    def __fold_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            args = expr_ast.get("args")
+            for i, arg in enumerate(args):
+                args[i] = self.__fold_expr(arg)
+            return expr_ast
+        if kind == InterpreterBase.NEG_NODE or kind == InterpreterBase.NOT_NODE:
+            op1 = self.__fold_expr(expr_ast.get("op1"))
+            expr_ast.dict["op1"] = op1
+            if kind == InterpreterBase.NEG_NODE and op1.elem_type == INT:
+                return literal_node(INT, -op1.get("val"), expr_ast.lineno)
+            if kind == InterpreterBase.NOT_NODE and (op1.elem_type == INT or op1.elem_type == BOOL):
+                return literal_node(BOOL, not op1.get("val"), expr_ast.lineno)
+            return expr_ast
+        if kind in BIN_OPS:
+            op1 = self.__fold_expr(expr_ast.get("op1"))
+            op2 = self.__fold_expr(expr_ast.get("op2"))
+            expr_ast.dict["op1"] = op1
+            expr_ast.dict["op2"] = op2
+            if op1.elem_type in LITERALS and op2.elem_type in LITERALS:
+                folded = self.__fold_binary(kind, op1, op2, expr_ast.lineno)
+                if folded is not None:
+                    return folded
+        return expr_ast
+
+    # the literal that oper applied to the literals left and right evaluates to, or None
+    # if evaluating it is an error
+    def __fold_binary(self, oper, left, right, lineno):
+        ltype = left.elem_type
+        rtype = right.elem_type
+        lval = left.get("val")
+        rval = right.get("val")
+        if ltype == INT and rtype == INT:
+            if oper in INT_OPS:
+                if oper == "/" and rval == 0:
+                    return None
+                return literal_node(INT, INT_OPS[oper](lval, rval), lineno)
+            if oper in INT_COMPARISONS:
+                return literal_node(BOOL, INT_COMPARISONS[oper](lval, rval), lineno)
+        if oper == "+" and ltype == STRING and rtype == STRING:
+            return literal_node(STRING, lval + rval, lineno)
+        if oper == "==" or oper == "!=":
+            if ltype == rtype or {ltype, rtype} == {INT, BOOL}:
+                if ltype != rtype:
+                    lval = bool(lval)
+                    rval = bool(rval)
+                return literal_node(BOOL, INT_COMPARISONS[oper](lval, rval), lineno)
+            return None
+        if oper == "&&" or oper == "||":
+            if ltype in (INT, BOOL) and rtype in (INT, BOOL):
+                if oper == "&&":
+                    return literal_node(BOOL, bool(lval) and bool(rval), lineno)
+                return literal_node(BOOL, bool(lval) or bool(rval), lineno)
+        return None
+
+
+# The LoopInvariantHoister finds subexpressions of for loops (their condition, update
+# and body) that evaluate to the same value on every pass through the loop: they only
+# read variables the loop never assigns or redefines, read struct fields only if
+# nothing in the loop can write one (a dotted assignment, or a call to a function that
+# isn't pure), and call only pure functions (see memov3.PurityChecker). Each one gets a
+# hidden temporary in its function's activation record.
+#
+# The temporary is cleared each time the loop that owns it (the outermost loop the
+# expression is invariant in) starts, and filled in the first time the expression is
+# evaluated, at its original place. So an expression in a branch that never runs is
+# never evaluated, and one that fails does so at the same point as before.
+#
+# Unlike the folder, it leaves the tree alone and records what it found in tables keyed
+# by node, so a tree shared through an astcache.ASTCache can still be run by any engine,
+# hoisted or not. It runs after the resolver, whose frame sizes its slots extend.
+BUILTINS = {"print", "inputi", "inputs"}  # they never write a variable or struct field
+
+
+class LoopInfo:
+    def __init__(self, for_ast):
+        self.for_ast = for_ast
+        self.written = set()  # names of variables assigned or defined in the loop
+        self.fields_written = False  # whether anything in the loop may write a struct field
+
+
+class LoopInvariantHoister:
+    # pure_functions is the set of (name, num args) of the functions that are pure;
+    # use_slots puts temporaries in frame slots past the resolver's, instead of by name
+    def __init__(self, pure_functions, use_slots):
+        self.pure_functions = pure_functions
+        self.use_slots = use_slots
+        self.temps = {}  # hoisted expression node -> its temporary's env key
+        self.loop_temps = {}  # for node -> env keys of the temporaries it owns
+        self.extra_slots = {}  # function node -> slots its temporaries need
+        self.func_ast = None
+        self.expressions_hoisted = 0
+        self.nodes_hoisted = 0
+
+    def hoist_program(self, ast):
+        for func_ast in ast.get("functions"):
+            self.func_ast = func_ast
+            self.__hoist_statements(func_ast.get("statements"), [])
+
+    # the size of the frame func_ast needs, temporaries included
+    def frame_size(self, func_ast):
+        extra = self.extra_slots.get(func_ast)
+        if extra is None:
+            return func_ast.get("frame_size")
+        return func_ast.get("frame_size") + extra
+
+    def __hoist_statements(self, statements, loops):
+        for statement in statements:
+            self.__hoist_statement(statement, loops)
+
+    # loops are the LoopInfos of the loops around statement, outermost first
+    def __hoist_statement(self, statement, loops):
+        kind = statement.elem_type
+        if kind == "=":
+            self.__hoist_expr(statement.get("expression"), loops)
+        elif kind == InterpreterBase.RETURN_NODE:
+            if statement.get("expression") is not None:
+                self.__hoist_expr(statement.get("expression"), loops)
+        elif kind == InterpreterBase.IF_NODE:
+            self.__hoist_expr(statement.get("condition"), loops)
+            self.__hoist_statements(statement.get("statements"), loops)
+            if statement.get("else_statements") is not None:
+                self.__hoist_statements(statement.get("else_statements"), loops)
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__hoist_statement(statement.get("init"), loops)
+            loop = LoopInfo(statement)
+            self.__find_writes_in_expr(statement.get("condition"), loop)
+            self.__find_writes(statement.get("update"), loop)
+            for body_statement in statement.get("statements"):
+                self.__find_writes(body_statement, loop)
+            inner = loops + [loop]
+            self.__hoist_expr(statement.get("condition"), inner)
+            self.__hoist_statement(statement.get("update"), inner)
+            self.__hoist_statements(statement.get("statements"), inner)
+        elif kind == InterpreterBase.FCALL_NODE:
+            self.__hoist_args(statement, loops)
+
+    def __find_writes(self, statement, loop):
+        kind = statement.elem_type
+        if kind == "=":
+            name = statement.get("name")
+            if "." in name:
+                loop.fields_written = True
+            else:
+                loop.written.add(name)
+            self.__find_writes_in_expr(statement.get("expression"), loop)
+        elif kind == InterpreterBase.VAR_DEF_NODE:
+            loop.written.add(statement.get("name"))
+        elif kind == InterpreterBase.RETURN_NODE:
+            if statement.get("expression") is not None:
+                self.__find_writes_in_expr(statement.get("expression"), loop)
+        elif kind == InterpreterBase.IF_NODE:
+            self.__find_writes_in_expr(statement.get("condition"), loop)
+            for s in statement.get("statements") + (statement.get("else_statements") or []):
+                self.__find_writes(s, loop)
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__find_writes(statement.get("init"), loop)
+            self.__find_writes_in_expr(statement.get("condition"), loop)
+            self.__find_writes(statement.get("update"), loop)
+            for s in statement.get("statements"):
+                self.__find_writes(s, loop)
+        elif kind == InterpreterBase.FCALL_NODE:
+            self.__find_writes_in_expr(statement, loop)
+
+    # only calls can write anything from inside an expression
+    def __find_writes_in_expr(self, expr_ast, loop):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            name = expr_ast.get("name")
+            if name not in BUILTINS and (name, len(expr_ast.get("args"))) not in self.pure_functions:
+                loop.fields_written = True
+            for arg_ast in expr_ast.get("args"):
+                self.__find_writes_in_expr(arg_ast, loop)
+            return
+        for operand in ("op1", "op2"):
+            if expr_ast.get(operand) is not None:
+                self.__find_writes_in_expr(expr_ast.get(operand), loop)
+
+    def __invariant_in(self, expr_ast, loop):
+        kind = expr_ast.elem_type
+        if kind in LITERALS:
+            return True
+        if kind == InterpreterBase.VAR_NODE:
+            path = expr_ast.get("name").split(".")
+            return path[0] not in loop.written and (len(path) == 1 or not loop.fields_written)
+        if kind == InterpreterBase.FCALL_NODE:
+            args = expr_ast.get("args")
+            return (expr_ast.get("name"), len(args)) in self.pure_functions and all(
+                self.__invariant_in(arg_ast, loop) for arg_ast in args
+            )
+        if kind in BIN_OPS or kind == InterpreterBase.NEG_NODE or kind == InterpreterBase.NOT_NODE:
+            return all(
+                self.__invariant_in(expr_ast.get(operand), loop)
+                for operand in ("op1", "op2")
+                if expr_ast.get(operand) is not None
+            )
+        return False  # new makes a different struct every time
+
+    def __hoist_expr(self, expr_ast, loops):
+        kind = expr_ast.elem_type
+        worth_hoisting = kind not in LITERALS and (
+            kind != InterpreterBase.VAR_NODE or "." in expr_ast.get("name")
+        )
+        if loops and worth_hoisting:
+            for loop in loops:
+                if self.__invariant_in(expr_ast, loop):
+                    self.__add_temp(expr_ast, loop)
+                    return
+        if kind == InterpreterBase.FCALL_NODE:
+            self.__hoist_args(expr_ast, loops)
+            return
+        for operand in ("op1", "op2"):
+            if expr_ast.get(operand) is not None:
+                self.__hoist_expr(expr_ast.get(operand), loops)
+
+    def __hoist_args(self, call_ast, loops):
+        for arg_ast in call_ast.get("args"):
+            self.__hoist_expr(arg_ast, loops)
+
+    def __add_temp(self, expr_ast, loop):
+        if self.use_slots:
+            extra = self.extra_slots.get(self.func_ast, 0)
+            key = self.func_ast.get("frame_size") + extra
+            self.extra_slots[self.func_ast] = extra + 1
+        else:
+            key = f"%invariant{self.expressions_hoisted}"
+        self.temps[expr_ast] = key
+        self.loop_temps.setdefault(loop.for_ast, []).append(key)
+        self.expressions_hoisted += 1
+        self.nodes_hoisted += count_nodes(expr_ast)
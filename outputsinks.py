@@ -0,0 +1,102 @@
+# Output sinks for InterpreterBase. By default an interpreter keeps every line a program
+# prints in output_log; give it one of these as output_sink instead to bound the memory
+# a chatty program's output takes. A sink has
+#   write(line)    called with each line the program prints
+#   reset()        called when the interpreter is reset for another run
+#   flush()        called when a run ends, successfully or with an error
+#   get_output()   what InterpreterBase.get_output() returns
+# A sink takes all of the output: console_output is ignored while one is set, so to
+# see the output on the console, use an FdSink on fd 1 (the default).
+
+import collections
+import hashlib
+import os
+
+
+# Writes lines to a file descriptor, buffering them until buffer_size bytes are waiting,
+# or flush_lines lines if that is set (flush_lines=1 writes every line immediately).
+# It keeps nothing, so get_output() returns an empty list.
+class FdSink:
+    def __init__(self, fd=1, buffer_size=64 * 1024, flush_lines=None):
+        self.fd = fd
+        self.buffer_size = buffer_size
+        self.flush_lines = flush_lines
+        self.pending = []
+        self.pending_bytes = 0
+        self.lines_written = 0
+
+    def write(self, line):
+        data = (str(line) + "\n").encode()
+        self.pending.append(data)
+        self.pending_bytes += len(data)
+        self.lines_written += 1
+        if self.pending_bytes >= self.buffer_size or (
+            self.flush_lines is not None and len(self.pending) >= self.flush_lines
+        ):
+            self.flush()
+
+    def reset(self):
+        self.flush()
+
+    def flush(self):
+        data = b"".join(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        while data:
+            written = os.write(self.fd, data)
+            data = data[written:]
+
+    def get_output(self):
+        return []
+
+
+# Keeps only the last max_lines lines.
+class RingBufferSink:
+    def __init__(self, max_lines):
+        self.lines = collections.deque(maxlen=max_lines)
+        self.lines_written = 0
+
+    def write(self, line):
+        self.lines.append(line)
+        self.lines_written += 1
+
+    def reset(self):
+        self.lines.clear()
+        self.lines_written = 0
+
+    def flush(self):
+        pass
+
+    def get_output(self):
+        return list(self.lines)
+
+
+# Keeps only a digest of the output, for comparing it with a golden output:
+# HashingSink.digest_of(expected_lines) is what get_output() returns after a run that
+# printed expected_lines.
+class HashingSink:
+    def __init__(self, algorithm="sha256"):
+        self.algorithm = algorithm
+        self.hash = hashlib.new(algorithm)
+        self.lines_written = 0
+
+    @staticmethod
+    def digest_of(lines, algorithm="sha256"):
+        sink = HashingSink(algorithm)
+        for line in lines:
+            sink.write(line)
+        return sink.get_output()
+
+    def write(self, line):
+        self.hash.update((str(line) + "\n").encode())
+        self.lines_written += 1
+
+    def reset(self):
+        self.hash = hashlib.new(self.algorithm)
+        self.lines_written = 0
+
+    def flush(self):
+        pass
+
+    def get_output(self):
+        return self.hash.hexdigest()
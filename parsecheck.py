@@ -0,0 +1,106 @@
+# Differential check of the two parsers: brewdescent.parse_program must give the same
+# tree (line numbers included), print the same syntax error message and raise the same
+# exception as brewparse.parse_program, with each lexer, on every input. The inputs
+# are the programs given on the command line (test.br by default), copies of them with
+# a few tokens deleted, inserted or replaced, and generated expressions.
+#
+#   python parsecheck.py [-n MUTANTS] [-e EXPRESSIONS] [-s SEED] [program.br ...]
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+
+import brewdescent
+import brewparse
+from astcache import encode_ast
+from brewscan import BrewinScanner
+
+# tokens inserted into mutated programs
+PIECES = [
+    "(", ")", "{", "}", ";", ",", ".", "=", "==", "-", "!", "+", "*", "/", "&&", "||", "<",
+    "x", "f", "1", '"s"', "nil", "true", "new", "var", "if", "else", "for", "try", "catch",
+    "raise", "return", "func", "struct", ":", "\n",
+]
+OPERANDS = ["a", "b.c", "1", "-x", "!y", "f()", "g(1, a)", "new s", "nil", "true", '"q"']
+OPERATORS = ["+", "-", "*", "/", "==", "!=", "<", "<=", ">", ">=", "&&", "||"]
+
+
+# the encoded tree or the exception, and whatever the parser printed
+def outcome(parse_program, program, lexer_name):
+    printed = io.StringIO()
+    with contextlib.redirect_stdout(printed):
+        try:
+            result = ("tree", encode_ast(parse_program(program, lexer_name)))
+        except (SyntaxError, RecursionError) as e:
+            result = (type(e).__name__, str(e))
+    return result, printed.getvalue()
+
+
+def tokens(program):
+    words = []
+    for tok in BrewinScanner().scan(program):
+        words.append(f'"{tok.value}"' if tok.type == "STRING" else str(tok.value))
+    return words
+
+
+def mutant(rng, words):
+    words = list(words)
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(len(words) + 1)
+        op = rng.random()
+        if op < 0.4 and i < len(words):
+            del words[i]
+        elif op < 0.8 or i == len(words):
+            words.insert(i, rng.choice(PIECES))
+        else:
+            words[i] = rng.choice(PIECES)
+    return " ".join(words)
+
+
+def expression(rng, depth):
+    if depth == 0 or rng.random() < 0.3:
+        return rng.choice(OPERANDS)
+    r = rng.random()
+    if r < 0.15:
+        return "(" + expression(rng, depth - 1) + ")"
+    if r < 0.25:
+        return rng.choice(["-", "!"]) + expression(rng, depth - 1)
+    return expression(rng, depth - 1) + " " + rng.choice(OPERATORS) + "\n " + expression(rng, depth - 1)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare the LALR and recursive-descent parsers.")
+    arg_parser.add_argument("paths", nargs="*", default=["test.br"], help="Brewin programs")
+    arg_parser.add_argument("-n", "--mutants", type=int, default=2000, help="mutated programs")
+    arg_parser.add_argument("-e", "--expressions", type=int, default=500, help="generated expressions")
+    arg_parser.add_argument("-s", "--seed", type=int, default=1, help="random seed")
+    args = arg_parser.parse_args()
+
+    programs = []
+    for path in args.paths:
+        with open(path, "r") as f:
+            programs.append(f.read())
+    rng = random.Random(args.seed)
+    token_lists = [tokens(program) for program in programs]
+    programs += [mutant(rng, rng.choice(token_lists)) for _ in range(args.mutants)]
+    programs += [
+        f"func main() {{\n x = {expression(rng, 5)};\n {expression(rng, 4)};\n}}" for _ in range(args.expressions)
+    ]
+
+    mismatches = 0
+    for program in programs:
+        for lexer_name in brewparse.LEXERS:
+            expected = outcome(brewparse.parse_program, program, lexer_name)
+            got = outcome(brewdescent.parse_program, program, lexer_name)
+            if got != expected:
+                mismatches += 1
+                print(f"MISMATCH with {lexer_name}: {program!r}\n  lalr    {expected}\n  descent {got}")
+    print(f"{len(programs)} programs x {len(brewparse.LEXERS)} lexers: {mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -40,7 +40,6 @@ import sys
 import types
 import copy
 import os
-import inspect
 
 # This tuple contains known string types
 try:
@@ -727,6 +726,7 @@ class LexerReflect(object):
 
     # Validate all of the t_rules collected
     def validate_rules(self):
+        import inspect  # only needed to validate the grammar module
         for state in self.stateinfo:
             # Validate all rules defined by functions
 
@@ -830,6 +830,7 @@ class LexerReflect(object):
     # -----------------------------------------------------------------------------
 
     def validate_module(self, module):
+        import inspect
         try:
             lines, linen = inspect.getsourcelines(module)
         except IOError:
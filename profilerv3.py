@@ -0,0 +1,97 @@
+# A deterministic (non-sampling) profiler for v3 Brewin programs. With
+# Interpreter(profile=True) the engine calls enter/leave around the body of every
+# Brewin function call and count_line for every statement it runs; without it the
+# interpreter only pays for one None check per call and per statement.
+#
+# report() lists call counts and inclusive/exclusive time per function, then the
+# most executed source lines. collapsed_stacks() gives one "main/0;f/1;g/2 <us>"
+# line per distinct call stack, the input format of flamegraph.pl and speedscope.
+#
+# Run a program under the profiler with
+#   python profilerv3.py program.br [collapsed_stacks_file]
+
+import sys
+import time
+
+
+class Profiler:
+    def __init__(self, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.functions = {}  # "name/arity" -> [calls, inclusive ns, exclusive ns]
+        self.line_counts = {}  # source line -> statements executed on it
+        self.call_tree = [0, {}]  # [exclusive ns, {callee name: call tree node}]
+        self.__frames = []  # [name, call tree node, start ns, ns spent in callees]
+        self.__active = {}  # name -> activations on the stack, so recursion isn't counted twice
+
+    def enter(self, func_ast):
+        name = f"{func_ast.get('name')}/{len(func_ast.get('args'))}"
+        parent = self.__frames[-1][1] if self.__frames else self.call_tree
+        node = parent[1].get(name)
+        if node is None:
+            node = parent[1][name] = [0, {}]
+        self.__active[name] = self.__active.get(name, 0) + 1
+        self.__frames.append([name, node, self.clock(), 0])
+
+    def leave(self):
+        elapsed = self.clock()
+        name, node, start, callee_time = self.__frames.pop()
+        elapsed -= start
+        stats = self.functions.get(name)
+        if stats is None:
+            stats = self.functions[name] = [0, 0, 0]
+        stats[0] += 1
+        stats[2] += elapsed - callee_time
+        node[0] += elapsed - callee_time
+        self.__active[name] -= 1
+        if self.__active[name] == 0:
+            stats[1] += elapsed
+        if self.__frames:
+            self.__frames[-1][3] += elapsed
+
+    def count_line(self, lineno):
+        self.line_counts[lineno] = self.line_counts.get(lineno, 0) + 1
+
+    def report(self, max_lines=20):
+        lines = [f"{'function':<30} {'calls':>10} {'inclusive ms':>14} {'exclusive ms':>14}"]
+        by_exclusive = sorted(self.functions.items(), key=lambda item: item[1][2], reverse=True)
+        for name, (calls, inclusive, exclusive) in by_exclusive:
+            lines.append(f"{name:<30} {calls:>10} {inclusive / 1e6:>14.3f} {exclusive / 1e6:>14.3f}")
+        lines.append("")
+        lines.append(f"{'line':>6} {'statements run':>16}")
+        by_count = sorted(self.line_counts.items(), key=lambda item: item[1], reverse=True)
+        for lineno, count in by_count[:max_lines]:
+            lines.append(f"{lineno:>6} {count:>16}")
+        return "\n".join(lines)
+
+    # exclusive time in microseconds for every call stack that spent any
+    def collapsed_stacks(self):
+        lines = []
+        pending = [((name,), node) for name, node in self.call_tree[1].items()]
+        while pending:
+            stack, node = pending.pop()
+            if node[0] // 1000 > 0:
+                lines.append(f"{';'.join(stack)} {node[0] // 1000}")
+            pending.extend((stack + (name,), child) for name, child in node[1].items())
+        return "\n".join(sorted(lines))
+
+
+def main():
+    import interpreterv3
+
+    if len(sys.argv) < 2:
+        print("usage: python profilerv3.py program.br [collapsed_stacks_file]")
+        sys.exit(2)
+    with open(sys.argv[1], "r") as f:
+        program = f.read()
+    interpreter = interpreterv3.Interpreter(profile=True)
+    try:
+        interpreter.run(program)
+    finally:
+        print(interpreter.profiler.report(), file=sys.stderr)
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], "w") as f:
+                f.write(interpreter.profiler.collapsed_stacks() + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# The SlotResolver walks each function once at load time and gives every formal
+# parameter and vardef its own slot index in the function's frame. Every variable
+# reference (var nodes and the base of an assignment target) is annotated with the
+# slot it refers to, so the FrameEnvironmentManager in env_v3.py can read and write
+# by index instead of searching a stack of dictionaries.
+#
+# Brewin scoping is lexical within a function, so a reference always sees the same
+# declaration no matter how many times the enclosing block runs. References that
+# can't be resolved, and duplicate definitions in the same block, are given
+# UNBOUND_SLOT; they only fail (with the usual NAME_ERROR) if actually executed.
+
+from intbase import InterpreterBase
+
+UNBOUND_SLOT = 0
+
+
+# the (possibly dotted) name of a var or "=" node as a tuple, split once and kept on the node
+def split_name(var_node):
+    path = var_node.get("path")
+    if path is None:
+        path = tuple(var_node.get("name").split("."))
+        var_node.dict["path"] = path
+    return path
+
+
+class SlotResolver:
+    def __init__(self):
+        self.scopes = []
+        self.next_slot = UNBOUND_SLOT + 1
+
+    def resolve_program(self, ast):
+        for func_ast in ast.get("functions"):
+            self.resolve_function(func_ast)
+
+    def resolve_function(self, func_ast):
+        self.next_slot = UNBOUND_SLOT + 1
+        self.scopes = [{}]
+        for formal_ast in func_ast.get("args"):
+            arg_name = formal_ast.get("name")
+            # a repeated formal name refers to the same variable; the last actual wins
+            slot = self.scopes[0].get(arg_name)
+            if slot is None:
+                slot = self.__declare(arg_name)
+            formal_ast.dict["slot"] = slot
+        self.__resolve_block(func_ast.get("statements"))
+        func_ast.dict["frame_size"] = self.next_slot
+
+    def __declare(self, name):
+        slot = self.next_slot
+        self.next_slot += 1
+        self.scopes[-1][name] = slot
+        return slot
+
+    def __lookup(self, var_node):
+        base_name = split_name(var_node)[0]
+        for scope in reversed(self.scopes):
+            if base_name in scope:
+                return scope[base_name]
+        return UNBOUND_SLOT
+
+    def __resolve_block(self, statements):
+        self.scopes.append({})
+        for statement in statements:
+            self.__resolve_statement(statement)
+        self.scopes.pop()
+
+    def __resolve_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.VAR_DEF_NODE:
+            var_name = statement.get("name")
+            if var_name in self.scopes[-1]:
+                statement.dict["slot"] = UNBOUND_SLOT
+            else:
+                statement.dict["slot"] = self.__declare(var_name)
+        elif kind == "=":
+            statement.dict["slot"] = self.__lookup(statement)
+            self.__resolve_expr(statement.get("expression"))
+        elif kind == InterpreterBase.RETURN_NODE:
+            if statement.get("expression") is not None:
+                self.__resolve_expr(statement.get("expression"))
+        elif kind == InterpreterBase.IF_NODE:
+            self.__resolve_expr(statement.get("condition"))
+            self.__resolve_block(statement.get("statements"))
+            if statement.get("else_statements") is not None:
+                self.__resolve_block(statement.get("else_statements"))
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__resolve_statement(statement.get("init"))
+            self.__resolve_expr(statement.get("condition"))
+            self.__resolve_statement(statement.get("update"))
+            self.__resolve_block(statement.get("statements"))
+        else:
+            self.__resolve_expr(statement)
+
+    def __resolve_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.VAR_NODE:
+            expr_ast.dict["slot"] = self.__lookup(expr_ast)
+        elif kind == InterpreterBase.FCALL_NODE:
+            for arg_ast in expr_ast.get("args"):
+                self.__resolve_expr(arg_ast)
+        else:
+            for operand in ("op1", "op2"):
+                if expr_ast.get(operand) is not None:
+                    self.__resolve_expr(expr_ast.get(operand))
@@ -1,5 +1,4 @@
-import copy
-from intbase import InterpreterBase
+from intbase import InterpreterBase, ErrorType
 
 
 # Enumerated type for our different language data types
@@ -13,6 +12,8 @@ class Type:
 
 # Represents a value, which has a type and its value
 class Value:
+    __slots__ = ("t", "v")
+
     def __init__(self, var_type, value=None):
         self.t = var_type
         self.v = value
@@ -24,6 +25,8 @@ class Value:
         return self.t
 
 class Variable:
+    __slots__ = ("t", "v")
+
     # var_value must be an object of type Value
     def __init__(self, var_type, var_value = None):
         self.t = var_type
@@ -38,37 +41,82 @@ class Variable:
     def set_value(self, new_value):
        self.v = new_value 
 
+
+# Values are never mutated once built, so the common ones are shared rather than
+# allocated each time: the bool, nil and void singletons, a table of small ints,
+# and the Value of each literal node (built on its first evaluation)
+TRUE_VALUE = Value(Type.BOOL, True)
+FALSE_VALUE = Value(Type.BOOL, False)
+NIL_VALUE = Value(Type.NIL, None)
+VOID_VALUE = Value(Type.VOID, None)
+EMPTY_STRING_VALUE = Value(Type.STRING, "")
+SMALL_INT_MIN = -256
+SMALL_INT_MAX = 1024
+SMALL_INT_VALUES = tuple(Value(Type.INT, i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1))
+
+
+def int_value(i):
+    if SMALL_INT_MIN <= i <= SMALL_INT_MAX:
+        return SMALL_INT_VALUES[i - SMALL_INT_MIN]
+    return Value(Type.INT, i)
+
+
+def bool_value(b):
+    if b:
+        return TRUE_VALUE
+    return FALSE_VALUE
+
+
+def literal_value(literal_ast):
+    value = literal_ast.get("value")
+    if value is None:
+        kind = literal_ast.elem_type
+        val = literal_ast.get("val")
+        if kind == InterpreterBase.INT_NODE:
+            value = int_value(val)
+        elif kind == InterpreterBase.BOOL_NODE:
+            value = bool_value(val)
+        elif kind == InterpreterBase.STRING_NODE:
+            value = Value(Type.STRING, val)
+        else:
+            value = NIL_VALUE
+        literal_ast.dict["value"] = value
+    return value
+
+
 class TypeManager:
     def __init__(self):
         self.__setup_valid_var_types()
         self.struct_defs = {}
+        self.struct_layouts = {}  # struct name -> tuple of (field name, field type, default Value)
+        self.struct_field_offsets = {}  # struct name -> {field name: index into the struct's field list}
 
     @staticmethod
     def create_value(val):
         if val == InterpreterBase.TRUE_DEF:
-            return Value(Type.BOOL, True)
+            return TRUE_VALUE
         elif val == InterpreterBase.FALSE_DEF:
-            return Value(Type.BOOL, False)
+            return FALSE_VALUE
         elif val == InterpreterBase.NIL_DEF:
-            return Value(Type.NIL, None)
+            return NIL_VALUE
         elif val == InterpreterBase.VOID_DEF:
-            return Value(Type.VOID, None)
+            return VOID_VALUE
         elif isinstance(val, str):
             return Value(Type.STRING, val)
         elif isinstance(val, int):
-            return Value(Type.INT, val)
+            return int_value(val)
         else:
             raise ValueError("Unknown value type")
 
     def create_default_value(self, for_type):
         if for_type == Type.BOOL:
-            return Value(Type.BOOL, False)
+            return FALSE_VALUE
         if for_type == Type.INT:
-            return Value(Type.INT, 0)
+            return int_value(0)
         if for_type == Type.STRING:
-            return Value(Type.STRING, "")
+            return EMPTY_STRING_VALUE
         if for_type == Type.VOID:
-            return Value(Type.VOID, None)
+            return VOID_VALUE
         if for_type == Type.NIL or for_type in self.struct_defs:
             return Value(for_type, None)
 
@@ -77,10 +125,56 @@ class TypeManager:
     def create_variable_with_default_value(self, for_type):
         return Variable(for_type, self.create_default_value(for_type))
 
+    # Values are immutable, so every instance shares the default Values in the layout
+    # and only needs fresh Variable cells; no deep copy of the template is required.
+    # A struct's value is a list of field Variables, in layout order.
     def new_struct_value(self, struct_type):
-        if struct_type not in self.struct_defs:
+        layout = self.struct_layouts.get(struct_type)
+        if layout is None:
             return None
-        return Value(struct_type, copy.deepcopy(self.struct_defs[struct_type]))
+        return Value(struct_type, [Variable(t, v) for _, t, v in layout])
+
+    def field_offset(self, struct_type, field_name):
+        return self.struct_field_offsets[struct_type].get(field_name)
+
+    # Follows the dotted path (a tuple of names, starting with the base variable's) from
+    # base_var and returns the final field Variable along with the field offsets it used.
+    # Field types are declared, so a given path always takes the same offsets; callers
+    # cache them and afterwards only need to check for nil along the way.
+    def resolve_field_path(self, base_var, path, error):
+        var_name = ".".join(path)
+        offsets = []
+        for i in range(1, len(path)):
+            val_type = base_var.value().type()
+            var_val = base_var.value().value()
+            if val_type == Type.NIL or (self.is_struct_type(val_type) and var_val is None):
+                error(
+                    ErrorType.FAULT_ERROR, f"Error dereferencing nil value {path[i - 1]} in {var_name}"
+                )
+            if not self.is_struct_type(val_type):
+                error(
+                    ErrorType.TYPE_ERROR, f"Dot used with non-struct {base_var} in {var_name}"
+                )
+            offset = self.field_offset(val_type, path[i])
+            if offset is None:
+                error(
+                    ErrorType.NAME_ERROR, f"Unknown member {path[i]} in {var_name}"
+                )
+            offsets.append(offset)
+            base_var = var_val[offset]
+        return base_var, tuple(offsets)
+
+    # the fast path once resolve_field_path has produced the offsets for path
+    @staticmethod
+    def follow_field_offsets(base_var, offsets, path, error):
+        for i, offset in enumerate(offsets):
+            fields = base_var.v.v
+            if fields is None:
+                error(
+                    ErrorType.FAULT_ERROR, f"Error dereferencing nil value {path[i]} in {'.'.join(path)}"
+                )
+            base_var = fields[offset]
+        return base_var
 
     def define_struct(self, struct_ast):
         struct_type_name = struct_ast.get("name")
@@ -100,6 +194,10 @@ class TypeManager:
                 return False
             default_struct[field_name] = default_value
 
+        self.struct_layouts[struct_type_name] = tuple(
+            (name, var.type(), var.value()) for name, var in default_struct.items()
+        )
+        self.struct_field_offsets[struct_type_name] = {name: i for i, name in enumerate(default_struct)}
         return True
 
     @staticmethod
@@ -0,0 +1,154 @@
+# The TypeChecker infers the static type of every expression from the declared types
+# of variables, struct fields, formal parameters and function returns. Wherever it can
+# prove that a value's type exactly matches its destination, it annotates the AST so
+# the interpreter can skip the runtime compatibility check and coercion:
+#   "=" nodes get type_safe=True when the rhs type equals the target's declared type
+#   return nodes get type_safe=True when the value's type equals the return type
+#   fcall nodes get safe_args, a tuple with one bool per argument
+# Anything it can't prove is left unannotated and checked at runtime as before, so
+# programs with type errors still fail with the same ErrorType at the same point.
+
+from intbase import InterpreterBase
+from type_valuev3 import Type
+
+
+class TypeChecker:
+    BOOL_RESULT_OPS = {"==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+    INT_RESULT_OPS = {"+", "-", "*", "/"}
+
+    def __init__(self, type_manager, func_name_to_ast):
+        self.type_manager = type_manager
+        self.func_name_to_ast = func_name_to_ast
+        self.scopes = []
+        self.return_type = None
+        self.sites_proved = 0
+        self.sites_total = 0
+
+    def check_program(self, ast):
+        for func_ast in ast.get("functions"):
+            self.check_function(func_ast)
+
+    def check_function(self, func_ast):
+        self.return_type = func_ast.get("return_type")
+        self.scopes = [{}]
+        for formal_ast in func_ast.get("args"):
+            self.scopes[0][formal_ast.get("name")] = formal_ast.get("var_type")
+        self.__check_block(func_ast.get("statements"))
+
+    def __record(self, proved):
+        self.sites_total += 1
+        if proved:
+            self.sites_proved += 1
+        return proved
+
+    def __check_block(self, statements):
+        self.scopes.append({})
+        for statement in statements:
+            self.__check_statement(statement)
+        self.scopes.pop()
+
+    def __check_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.VAR_DEF_NODE:
+            # a duplicate definition fails at runtime, so only the first one is ever visible
+            self.scopes[-1].setdefault(statement.get("name"), statement.get("var_type"))
+        elif kind == "=":
+            self.__check_assign(statement)
+        elif kind == InterpreterBase.RETURN_NODE:
+            expr_ast = statement.get("expression")
+            if expr_ast is not None:
+                expr_type = self.__type_of(expr_ast)
+                statement.dict["type_safe"] = self.__record(
+                    expr_type is not None and expr_type != Type.VOID and expr_type == self.return_type
+                )
+        elif kind == InterpreterBase.IF_NODE:
+            self.__type_of(statement.get("condition"))
+            self.__check_block(statement.get("statements"))
+            if statement.get("else_statements") is not None:
+                self.__check_block(statement.get("else_statements"))
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__check_assign(statement.get("init"))
+            self.__type_of(statement.get("condition"))
+            self.__check_assign(statement.get("update"))
+            self.__check_block(statement.get("statements"))
+        else:
+            self.__type_of(statement)
+
+    def __check_assign(self, assign_ast):
+        target_type = self.__variable_type(assign_ast.get("name"))
+        expr_type = self.__type_of(assign_ast.get("expression"))
+        assign_ast.dict["type_safe"] = self.__record(
+            expr_type is not None and expr_type != Type.VOID and expr_type == target_type
+        )
+
+    # the declared type of a (possibly dotted) variable name, or None if unknown
+    def __variable_type(self, var_name):
+        split_var = var_name.split(".")
+        var_type = None
+        for scope in reversed(self.scopes):
+            if split_var[0] in scope:
+                var_type = scope[split_var[0]]
+                break
+        for field in split_var[1:]:
+            layout = self.type_manager.struct_layouts.get(var_type)
+            if layout is None:
+                return None
+            var_type = None
+            for field_name, field_type, _ in layout:
+                if field_name == field:
+                    var_type = field_type
+        return var_type
+
+    # the type every successful evaluation of expr_ast produces, or None if unknown
+    def __type_of(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.INT_NODE:
+            return Type.INT
+        if kind == InterpreterBase.STRING_NODE:
+            return Type.STRING
+        if kind == InterpreterBase.BOOL_NODE:
+            return Type.BOOL
+        if kind == InterpreterBase.NIL_NODE:
+            return Type.NIL
+        if kind == InterpreterBase.VAR_NODE:
+            return self.__variable_type(expr_ast.get("name"))
+        if kind == InterpreterBase.NEW_NODE:
+            var_type = expr_ast.get("var_type")
+            return var_type if self.type_manager.is_struct_type(var_type) else None
+        if kind == InterpreterBase.NEG_NODE:
+            self.__type_of(expr_ast.get("op1"))
+            return Type.INT
+        if kind == InterpreterBase.NOT_NODE:
+            self.__type_of(expr_ast.get("op1"))
+            return Type.BOOL
+        if kind == InterpreterBase.FCALL_NODE:
+            return self.__check_call(expr_ast)
+        if kind not in TypeChecker.BOOL_RESULT_OPS and kind not in TypeChecker.INT_RESULT_OPS:
+            return None  # e.g. a raise or try statement, which v3 doesn't run
+        type1 = self.__type_of(expr_ast.get("op1"))
+        type2 = self.__type_of(expr_ast.get("op2"))
+        if kind in TypeChecker.BOOL_RESULT_OPS:
+            return Type.BOOL
+        if kind in TypeChecker.INT_RESULT_OPS and type1 == type2:
+            if type1 == Type.INT or (kind == "+" and type1 == Type.STRING):
+                return type1
+        return None
+
+    def __check_call(self, call_ast):
+        func_name = call_ast.get("name")
+        actual_args = call_ast.get("args")
+        arg_types = [self.__type_of(arg_ast) for arg_ast in actual_args]
+        if func_name == "print":
+            return Type.VOID
+        if func_name == "inputi":
+            return Type.INT
+        if func_name == "inputs":
+            return Type.STRING
+        func_ast = self.func_name_to_ast.get(func_name, {}).get(len(actual_args))
+        if func_ast is None:
+            return None
+        call_ast.dict["safe_args"] = tuple(
+            self.__record(arg_type is not None and arg_type == formal_ast.get("var_type"))
+            for arg_type, formal_ast in zip(arg_types, func_ast.get("args"))
+        )
+        return func_ast.get("return_type")